@@ -0,0 +1,163 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from typing import List, Optional, Tuple, TYPE_CHECKING
+import numpy as np
+from alliance import Alliance
+if TYPE_CHECKING:
+    from cargo import Cargo
+    from field import Field
+    from robot import Robot
+
+# Largest number of robots of an alliance the optimal assignment is solved for, above it the greedy one is used
+MAX_OPTIMAL_ROBOTS = 32
+
+
+class NearestAssignment:
+    """
+    Every robot selects the free cargo with the shortest drive around the hub by itself, as soon as it needs one.
+    """
+    name = "nearest"
+    # Whether robots wait for assign() instead of selecting cargo by themselves
+    batched = False
+
+    def select(self, field: Field, robot: Robot) -> Optional[Cargo]:
+        # robot imports field, which imports this module
+        from robot import cargo_travel_distance
+        return field.select_nearest_cargo(robot.alliance, robot.position, cargo_travel_distance)
+
+    def assign(self, field: Field, robots: List[Robot]):
+        pass
+
+
+class BatchAssignment(NearestAssignment, ABC):
+    """
+    Robots needing cargo wait for the next assignment, which matches all of an alliance's waiting robots with its free
+    cargo at once, from the matrix of travel distances between them.
+    """
+    batched = True
+
+    def select(self, field: Field, robot: Robot) -> Optional[Cargo]:
+        return None
+
+    def assign(self, field: Field, robots: List[Robot]):
+        from robot import travel_distances
+        for alliance in (Alliance.RED, Alliance.BLUE):
+            waiting = [robot for robot in robots if robot.alliance == alliance and
+                       robot.current_action == robot.SELECT and robot.selected_cargo is None]
+            if not waiting or not len(field.selectable_cargo[alliance]):
+                continue
+            cargo = list(field.selectable_cargo[alliance])
+            robot_positions = np.array([robot.position for robot in waiting])
+            cargo_positions = np.array([(item.x, item.y) for item in cargo])
+            distances = travel_distances(robot_positions[:, None, 0], robot_positions[:, None, 1],
+                                         cargo_positions[None, :, 0], cargo_positions[None, :, 1])
+            for robot_idx, cargo_idx in self.match(distances):
+                waiting[robot_idx].selected_cargo = cargo[cargo_idx]
+                field.select_cargo(cargo[cargo_idx])
+
+    @abstractmethod
+    def match(self, distances: np.ndarray) -> List[Tuple[int, int]]:
+        """
+        Pairs of (robot, cargo) indices of the distance matrix to assign, each robot and cargo appearing at most once.
+        """
+
+
+class GreedyAssignment(BatchAssignment):
+    """
+    Repeatedly assigns the closest pair of a waiting robot and free cargo.
+    """
+    name = "greedy"
+
+    def match(self, distances: np.ndarray) -> List[Tuple[int, int]]:
+        return greedy_assignment(distances)
+
+
+class OptimalAssignment(BatchAssignment):
+    """
+    Assigns cargo so that the total distance driven is minimal, for up to MAX_OPTIMAL_ROBOTS waiting robots.
+    """
+    name = "optimal"
+
+    def match(self, distances: np.ndarray) -> List[Tuple[int, int]]:
+        if min(distances.shape) > MAX_OPTIMAL_ROBOTS:
+            return greedy_assignment(distances)
+        return optimal_assignment(distances)
+
+
+ASSIGNMENTS = {assignment.name: assignment for assignment in (NearestAssignment, GreedyAssignment, OptimalAssignment)}
+
+
+def create_assignment(name: str) -> NearestAssignment:
+    return ASSIGNMENTS[name]()
+
+
+def greedy_assignment(cost: np.ndarray) -> List[Tuple[int, int]]:
+    rows, columns = cost.shape
+    used_rows = np.zeros(rows, dtype=bool)
+    used_columns = np.zeros(columns, dtype=bool)
+    pairs = []
+    for flat in np.argsort(cost, axis=None, kind="stable"):
+        row, column = divmod(int(flat), columns)
+        if used_rows[row] or used_columns[column]:
+            continue
+        used_rows[row] = used_columns[column] = True
+        pairs.append((row, column))
+        if len(pairs) == min(rows, columns):
+            break
+    return pairs
+
+
+def optimal_assignment(cost: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    The Hungarian algorithm (in its shortest augmenting path form), in O(rows^2 * columns) with the work on columns
+    vectorized. Returns the (row, column) pairs of a minimal cost assignment of every row, or of every column if there
+    are fewer columns than rows.
+    """
+    if cost.shape[0] > cost.shape[1]:
+        return [(row, column) for column, row in optimal_assignment(cost.T)]
+    rows, columns = cost.shape
+    # Potentials and matching are 1-based, index 0 being a virtual column holding the row being added
+    row_potential = np.zeros(rows + 1)
+    column_potential = np.zeros(columns + 1)
+    column_row = np.zeros(columns + 1, dtype=np.int64)
+    previous_column = np.zeros(columns + 1, dtype=np.int64)
+    for row in range(1, rows + 1):
+        column_row[0] = row
+        column = 0
+        min_slack = np.full(columns + 1, np.inf)
+        visited = np.zeros(columns + 1, dtype=bool)
+        while column_row[column]:
+            visited[column] = True
+            current_row = column_row[column]
+            slack = cost[current_row - 1] - row_potential[current_row] - column_potential[1:]
+            improved = ~visited[1:] & (slack < min_slack[1:])
+            min_slack[1:][improved] = slack[improved]
+            previous_column[1:][improved] = column
+            candidates = np.where(visited[1:], np.inf, min_slack[1:])
+            next_column = int(candidates.argmin()) + 1
+            delta = candidates[next_column - 1]
+            row_potential[column_row[visited]] += delta
+            column_potential[visited] -= delta
+            min_slack[1:][~visited[1:]] -= delta
+            column = next_column
+        # Flip the augmenting path back to the virtual column
+        while column:
+            column_row[column] = column_row[previous_column[column]]
+            column = previous_column[column]
+    return [(int(column_row[column]) - 1, column - 1) for column in range(1, columns + 1) if column_row[column]]
+
+
+if __name__ == '__main__':
+    # Compare the optimal assignment with brute force on small random matrices
+    from itertools import permutations
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        rows, columns = (int(size) for size in rng.integers(1, 6, size=2))
+        cost = rng.random((rows, columns))
+        best = min(sum(cost[row, column] for row, column in enumerate(perm))
+                   for perm in permutations(range(columns), rows)) if rows <= columns else \
+            min(sum(cost[row, column] for column, row in enumerate(perm)) for perm in permutations(range(rows), columns))
+        found = optimal_assignment(cost)
+        assert len(found) == min(rows, columns)
+        assert abs(sum(cost[row, column] for row, column in found) - best) < 1e-9, (cost, found)
+    print("optimal_assignment matches brute force")
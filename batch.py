@@ -0,0 +1,156 @@
+from __future__ import annotations
+import os
+from collections import deque
+from math import ceil
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
+import numpy as np
+from alliance import Alliance
+from config import load_config
+from results import ResultSink, MatchRowWriter
+from scenarios import Scenario
+from simulation import simulate, DEFAULT_DT, ENGINES
+from vectorized import run_vectorized
+
+PERCENTILES = (5, 25, 50, 75, 95)
+MAX_MATCHES_PER_TASK = 64
+TASKS_PER_WORKER = 4
+# The vectorized engine runs matches in fixed-size groups, each seeded on its own, so results do not depend on the
+# number of workers
+VECTORIZED_GROUP_SIZE = 1024
+BATCH_ENGINES = ENGINES + ("vector",)
+
+
+def seed_chunks(master_seed: int, num_items: int, chunk_size: int) -> Iterator[List[np.random.SeedSequence]]:
+    """
+    Derive one independent seed per match from a single master seed, as children of the master seed's SeedSequence,
+    chunk_size at a time instead of all at once.
+    Seeds depend only on the master seed and the match index, so results do not depend on the number of workers.
+    The children are passed on as they are rather than reduced to integers, which would collide between matches of
+    large batches.
+    """
+    sequence = np.random.SeedSequence(master_seed)
+    for start in range(0, num_items, chunk_size):
+        yield sequence.spawn(min(chunk_size, num_items - start))
+
+
+def ordered_map(executor: Executor, function: Callable, tasks: Iterable[tuple], window: int) -> Iterator:
+    """
+    Like Executor.map, but with at most window tasks submitted and not yet consumed at once, so neither the tasks
+    nor their results pile up in memory.
+    """
+    pending = deque()
+    for task in tasks:
+        pending.append(executor.submit(function, *task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+@contextmanager
+def optional_pool(executor: Optional[Executor], workers: int):
+    """
+    Use the given executor, or a new process pool that is shut down afterwards.
+    """
+    if executor:
+        yield executor
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield pool
+
+
+def aggregate_matches(config: Union[dict, Scenario], seeds: List[np.random.SeedSequence], dt: float, engine: str,
+                      record_paths: List[Optional[str]], keep_rows: bool) -> Tuple[ResultSink, Optional[np.ndarray]]:
+    """
+    Run matches into a sink of their own, and return it with the matches' rows (see results.MatchRowWriter) if
+    keep_rows is set.
+    """
+    sink = ResultSink()
+    scores = np.empty((len(seeds), 2), dtype=np.int64)
+    shots_made = []
+    for i, (seed, record_path) in enumerate(zip(seeds, record_paths)):
+        result = simulate(config, seed, dt, engine, record_path)
+        scores[i] = result.score[Alliance.RED], result.score[Alliance.BLUE]
+        sink.add_robot_stats(result.robot_stats)
+        if keep_rows:
+            shots_made.append([stats["shots_made"] for stats in result.robot_stats])
+    sink.add_scores(scores)
+    return sink, np.column_stack((scores, np.array(shots_made, dtype=np.int64))) if keep_rows else None
+
+
+def aggregate_vectorized(config: Union[dict, Scenario], num_matches: int, seeds: List[np.random.SeedSequence],
+                         dt: float, keep_rows: bool) -> Tuple[ResultSink, Optional[np.ndarray]]:
+    sink = ResultSink()
+    scores = run_vectorized(config, num_matches, seeds[0], dt)
+    sink.add_scores(scores)
+    return sink, scores if keep_rows else None
+
+
+def aggregate_batch(config: Union[str, dict, Scenario], num_matches: int, master_seed: int = 0, workers: int = None,
+                    dt: float = DEFAULT_DT, engine: str = "tick", record_dir: str = None, executor: Executor = None,
+                    rows_path: str = None) -> ResultSink:
+    """
+    Run num_matches independent matches across a process pool and aggregate their results into a ResultSink as they
+    come in instead of keeping every score, so memory does not grow with the number of matches. Every task aggregates
+    its matches into a sink of its own, which is merged here.
+    Every match gets its own seed derived from master_seed, so results do not depend on the number of workers. If
+    record_dir is given, every match is recorded into it as match_<index>.rrrec. An existing executor may be passed to
+    share one pool between several batches.
+    If rows_path is given, every match's row is also appended to it (see results.MatchRowWriter). Rows of the vector
+    engine only hold the scores, as it keeps no robot stats.
+    A compiled scenario is built into every match as it is, without validating its configuration again.
+    """
+    if isinstance(config, str):
+        config = load_config(config)
+    workers = workers or os.cpu_count()
+    keep_rows = rows_path is not None
+    if engine == "vector":
+        if record_dir:
+            raise ValueError("Matches can only be recorded by the tick engine")
+        num_robots = 0
+        sizes = (min(VECTORIZED_GROUP_SIZE, num_matches - i) for i in range(0, num_matches, VECTORIZED_GROUP_SIZE))
+        tasks = ((config, size, seeds, dt, keep_rows)
+                 for size, seeds in zip(sizes, seed_chunks(master_seed, ceil(num_matches / VECTORIZED_GROUP_SIZE), 1)))
+        function = aggregate_vectorized
+    else:
+        num_robots = config.num_robots if isinstance(config, Scenario) else len(config["robots"])
+        if record_dir:
+            os.makedirs(record_dir, exist_ok=True)
+        chunk_size = max(1, min(MAX_MATCHES_PER_TASK, ceil(num_matches / (workers * TASKS_PER_WORKER))))
+        tasks = ((config, seeds, dt, engine,
+                  [os.path.join(record_dir, f"match_{start + i:06d}.rrrec") if record_dir else None
+                   for i in range(len(seeds))], keep_rows)
+                 for start, seeds in zip(range(0, num_matches, chunk_size),
+                                         seed_chunks(master_seed, num_matches, chunk_size)))
+        function = aggregate_matches
+
+    sink = ResultSink()
+    writer = MatchRowWriter(rows_path, num_robots) if keep_rows else None
+    with optional_pool(executor, workers) if workers > 1 or executor else nullcontext() as pool:
+        results = ordered_map(pool, function, tasks, workers * TASKS_PER_WORKER) if pool else \
+            (function(*task) for task in tasks)
+        for partial, rows in results:
+            sink.merge(partial)
+            if writer:
+                writer.write(rows)
+    if writer:
+        writer.flush()
+    return sink
+
+
+def format_summary(summary: dict) -> str:
+    lines = [f"Matches: {summary['matches']}"]
+    if not summary["matches"]:
+        return lines[0]
+    for alliance in (Alliance.RED, Alliance.BLUE):
+        stats = summary[alliance.value]
+        percentiles = ", ".join(f"p{p}={v:.1f}" for p, v in stats["percentiles"].items())
+        lines.append(f"{alliance.value:<5} mean={stats['mean']:.2f} std={stats['std']:.2f} {percentiles} "
+                     f"win_rate={stats['win_rate']:.3f}")
+    lines.append(f"Ties: {summary['tie_rate']:.3f}")
+    for i, robot in enumerate(summary.get("robots", ())):
+        lines.append(f"Robot {i} ({robot['alliance']}) per match: collected={robot['cargo_collected']:.2f} "
+                     f"made={robot['shots_made']:.2f} missed={robot['shots_missed']:.2f}")
+    return "\n".join(lines)
@@ -0,0 +1,281 @@
+from __future__ import annotations
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from math import ceil
+from typing import List, Tuple
+import numpy as np
+from cargo import FIELD_WIDTH, FIELD_HEIGHT, NUM_CARGO, load_cargo_distribution
+from config import build_match
+from robot import is_inside_obstacle, _cached_routes
+from simulation import step, DEFAULT_DT
+from vectorized import check_against_scalar
+
+BENCHMARK_VERSION = 1
+BENCHMARK_SEED = 0
+LATENCY_PERCENTILES = (50, 90, 99)
+# Tail latencies are dominated by the rest of the machine, so they are reported but not compared against baselines
+COMPARED_PERCENTILES = (50, 90)
+# Relative change of a metric that counts as a regression when comparing against a baseline
+DEFAULT_TOLERANCE = 0.25
+# Scenario axes, every scenario varies a single one and keeps the others at the defaults
+DEFAULT_ROBOTS = 6
+DEFAULT_GRID = (9, 17)
+DEFAULT_MATCH_LENGTH = 120.0
+ROBOT_COUNTS = (6, 20, 50, 200)
+CARGO_COUNTS = (NUM_CARGO, 100, 1000, 3000)
+GRID_SIZES = ((3, 6), (9, 17), (90, 170), (270, 510))
+MATCH_LENGTHS = (30.0, 120.0, 600.0)
+# Quick runs cut every match short, for smoke testing the benchmarks themselves
+QUICK_MATCH_LENGTH = 10.0
+CONGESTION_PENALTY = 0.1
+# Modules a headless worker imports, none of which may pull in pygame or the graphics. Spawned workers also import the
+# entry module again, as __mp_main__.
+HEADLESS_MODULES = ("alliance", "cargo", "field", "game", "robot", "config", "simulation", "events", "batch", "rrsim")
+GRAPHICS_MODULES = ("pygame", "graphics", "window")
+# Command timed by the startup check, and modules its arguments must not import, as only other commands use them
+STARTUP_COMMAND = "batch"
+UNUSED_COMMAND_MODULES = ("telemetry", "asyncio", "benchmark", "tracemalloc", "estimator", "sweep", "snapshot")
+# Longest time importing the headless modules may take in a new interpreter, on top of importing numpy
+MAX_STARTUP_TIME = 0.2
+# The vectorized engine is checked against the tick engine on this many matches of this length, from BENCHMARK_SEED
+EQUIVALENCE_MATCHES = 300
+EQUIVALENCE_MATCH_LENGTH = 30.0
+
+
+class Scenario:
+    def __init__(self, name: str, num_robots: int = DEFAULT_ROBOTS, num_cargo: int = NUM_CARGO,
+                 grid: Tuple[int, int] = DEFAULT_GRID, match_length: float = DEFAULT_MATCH_LENGTH,
+                 congestion_penalty: float = 0.0):
+        self.name = name
+        self.num_robots = num_robots
+        self.num_cargo = num_cargo
+        self.grid = grid
+        self.match_length = match_length
+        self.congestion_penalty = congestion_penalty
+
+    def parameters(self) -> dict:
+        return {"num_robots": self.num_robots, "num_cargo": self.num_cargo, "grid": list(self.grid),
+                "match_length": self.match_length, "congestion_penalty": self.congestion_penalty}
+
+
+def default_scenarios() -> List[Scenario]:
+    return ([Scenario(f"robots_{count}", num_robots=count) for count in ROBOT_COUNTS] +
+            [Scenario(f"cargo_{count}", num_cargo=count) for count in CARGO_COUNTS] +
+            [Scenario(f"grid_{rows}x{columns}", grid=(rows, columns)) for rows, columns in GRID_SIZES] +
+            [Scenario(f"length_{length:g}", match_length=length) for length in MATCH_LENGTHS] +
+            [Scenario(f"congestion_{count}", num_robots=count, congestion_penalty=CONGESTION_PENALTY)
+             for count in ROBOT_COUNTS])
+
+
+def write_distribution(path: str, grid: Tuple[int, int], rng: np.random.Generator):
+    rows, columns = grid
+    weights = rng.integers(0, 10, size=(rows, columns))
+    # A distribution must have some weight to draw from
+    weights[0, 0] += 1
+    np.savetxt(path, weights, fmt="%d", delimiter=", ")
+
+
+def synthetic_config(scenario: Scenario, distribution_path: str, rng: np.random.Generator) -> dict:
+    """
+    A configuration of the scenario's size, with random robots split evenly between the alliances.
+    """
+    robots = []
+    for i in range(scenario.num_robots):
+        while True:
+            position = (float(rng.uniform(0.5, FIELD_WIDTH - 0.5)), float(rng.uniform(0.5, FIELD_HEIGHT - 0.5)))
+            if not is_inside_obstacle(position):
+                break
+        robots.append({
+            "starting_position": list(position),
+            "collect_time": float(rng.uniform(2.0, 6.0)),
+            "shoot_time": float(rng.uniform(1.0, 2.0)),
+            "velocity": float(rng.uniform(3.0, 5.0)),
+            "accuracy": float(rng.uniform(0.6, 1.0)),
+            "alliance": "RED" if i % 2 == 0 else "BLUE",
+        })
+    return {"field": {"cargo_hub_timeout": 7.0, "match_length": scenario.match_length,
+                      "cargo_distribution": distribution_path, "num_cargo": scenario.num_cargo,
+                      "congestion_penalty": scenario.congestion_penalty},
+            "robots": robots}
+
+
+def time_match(config: dict, dt: float) -> Tuple[float, np.ndarray]:
+    """
+    Run a match and return its total wall time and the wall time of every step.
+    """
+    field, robots, match_length = build_match(config, BENCHMARK_SEED)
+    num_steps = ceil(match_length / dt - 1e-9)
+    latencies = np.empty(num_steps)
+    perf_counter = time.perf_counter
+    start = perf_counter()
+    for i in range(num_steps):
+        step_start = perf_counter()
+        step(field, robots, dt)
+        latencies[i] = perf_counter() - step_start
+    return perf_counter() - start, latencies
+
+
+def measure_peak_memory(config: dict, dt: float) -> int:
+    """
+    The peak memory allocated while building and running a match, in bytes.
+    Tracing slows the simulation down, so it is measured on a separate run from the timings. The caches that run
+    filled are cleared first, so that the cargo distribution and the routes are allocated again while tracing.
+    """
+    load_cargo_distribution.cache_clear()
+    _cached_routes.cache_clear()
+    tracemalloc.start()
+    try:
+        field, robots, match_length = build_match(config, BENCHMARK_SEED)
+        for _ in range(ceil(match_length / dt - 1e-9)):
+            step(field, robots, dt)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_scenario(scenario: Scenario, config: dict, dt: float, repeats: int) -> dict:
+    # The fastest repeat is the one least disturbed by the rest of the machine
+    wall_time, latencies = min((time_match(config, dt) for _ in range(repeats)), key=lambda timing: timing[0])
+    return {
+        "parameters": scenario.parameters(),
+        "steps": len(latencies),
+        "wall_time": wall_time,
+        "sim_to_wall_ratio": scenario.match_length / wall_time,
+        "step_latency_us": dict([(f"p{percentile}", float(np.percentile(latencies, percentile) * 1e6))
+                                 for percentile in LATENCY_PERCENTILES] + [("max", float(latencies.max() * 1e6))]),
+        "peak_memory_bytes": measure_peak_memory(config, dt),
+    }
+
+
+def run_benchmarks(scenarios: List[Scenario] = None, dt: float = DEFAULT_DT, repeats: int = 3,
+                   quick: bool = False, progress=None) -> dict:
+    """
+    Run every scenario on the headless tick engine and return the results with a description of the machine.
+    Configurations are generated from fixed seeds, so the same scenarios are simulated on every run.
+    """
+    scenarios = scenarios if scenarios is not None else default_scenarios()
+    results = {}
+    with tempfile.TemporaryDirectory() as distribution_dir:
+        for scenario in scenarios:
+            if quick:
+                scenario = Scenario(scenario.name, scenario.num_robots, scenario.num_cargo, scenario.grid,
+                                    min(scenario.match_length, QUICK_MATCH_LENGTH), scenario.congestion_penalty)
+            # Every scenario has its own generator, so running a subset of the scenarios does not change them
+            rng = np.random.default_rng([BENCHMARK_SEED, zlib.crc32(scenario.name.encode())])
+            distribution_path = os.path.join(distribution_dir, f"{scenario.name}.csv")
+            write_distribution(distribution_path, scenario.grid, rng)
+            config = synthetic_config(scenario, distribution_path, rng)
+            results[scenario.name] = run_scenario(scenario, config, dt, repeats)
+            if progress:
+                progress(scenario.name, results[scenario.name])
+    return {
+        "version": BENCHMARK_VERSION,
+        "machine": {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+                    "processor": platform.processor()},
+        "dt": dt,
+        "quick": quick,
+        "scenarios": results,
+    }
+
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """
+    Describe every metric of a scenario present in both results that got worse than the baseline by more than
+    tolerance (relative). Results of different dt or quick modes are not comparable.
+    """
+    if (results["dt"], results["quick"]) != (baseline["dt"], baseline["quick"]):
+        raise ValueError("Benchmark results and baseline were run with different settings")
+    regressions = []
+    for name, result in results["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if base is None:
+            continue
+        # (metric, current value, baseline value, whether higher is better)
+        metrics = [("sim_to_wall_ratio", result["sim_to_wall_ratio"], base["sim_to_wall_ratio"], True),
+                   ("peak_memory_bytes", result["peak_memory_bytes"], base["peak_memory_bytes"], False)]
+        metrics += [(f"step_latency_us.p{percentile}", result["step_latency_us"][f"p{percentile}"],
+                     base["step_latency_us"][f"p{percentile}"], False) for percentile in COMPARED_PERCENTILES]
+        for metric, value, base_value, higher_is_better in metrics:
+            change = (value - base_value) / base_value if base_value else 0.0
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{name}: {metric} {base_value:.6g} -> {value:.6g} ({change:+.1%})")
+    return regressions
+
+
+def format_result(name: str, result: dict) -> str:
+    latency = result["step_latency_us"]
+    return (f"{name:>16} {result['sim_to_wall_ratio']:>10.1f}x {latency['p50']:>9.1f} {latency['p90']:>9.1f} "
+            f"{latency['p99']:>9.1f} {result['peak_memory_bytes'] / 2 ** 20:>9.2f}")
+
+
+def format_header() -> str:
+    return f"{'scenario':>16} {'sim/wall':>11} {'p50 us':>9} {'p90 us':>9} {'p99 us':>9} {'peak MiB':>9}"
+
+
+def load_results(path: str) -> dict:
+    with open(path, "r") as results_file:
+        return json.load(results_file)
+
+
+def measure_startup(modules: Tuple[str, ...] = HEADLESS_MODULES) -> dict:
+    """
+    Import modules in a new interpreter, like a freshly spawned worker, and return how long it took after importing
+    numpy (timed on its own, as it is out of our hands) and which graphics modules were imported along the way.
+    The arguments of STARTUP_COMMAND are then parsed by rrsim.parse_args, which is timed as well, and the modules of
+    UNUSED_COMMAND_MODULES it imported are returned.
+    """
+    code = ("import json, sys, time\n"
+            "start = time.perf_counter()\n"
+            "import numpy\n"
+            "numpy_time = time.perf_counter() - start\n"
+            "start = time.perf_counter()\n"
+            f"for module in {list(modules)!r}:\n"
+            "    __import__(module)\n"
+            "elapsed = time.perf_counter() - start\n"
+            f"graphics = sorted({{name.split('.')[0] for name in sys.modules}} & {set(GRAPHICS_MODULES)!r})\n"
+            "start = time.perf_counter()\n"
+            "import rrsim\n"
+            f"rrsim.parse_args([{STARTUP_COMMAND!r}])\n"
+            "parse_time = time.perf_counter() - start\n"
+            f"unused = sorted({{name.split('.')[0] for name in sys.modules}} & {set(UNUSED_COMMAND_MODULES)!r})\n"
+            "print(json.dumps({'import_time': elapsed, 'numpy_time': numpy_time, 'graphics_modules': graphics,\n"
+            "                  'parse_time': parse_time, 'unused_modules': unused}))")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    # The report is the last line, after anything printed by the imported modules
+    return json.loads(output.splitlines()[-1])
+
+
+def check_startup(startup: dict, max_time: float = MAX_STARTUP_TIME) -> List[str]:
+    problems = []
+    if startup["graphics_modules"]:
+        problems.append(f"headless modules import {', '.join(startup['graphics_modules'])}")
+    if startup["unused_modules"]:
+        problems.append(f"parsing the {STARTUP_COMMAND} command imports {', '.join(startup['unused_modules'])}")
+    startup_time = startup["import_time"] + startup["parse_time"]
+    if startup_time > max_time:
+        problems.append(f"headless modules and parsing the {STARTUP_COMMAND} command take "
+                        f"{startup_time * 1000:.0f}ms (at most {max_time * 1000:.0f}ms)")
+    return problems
+
+
+def check_equivalence(dt: float = DEFAULT_DT) -> dict:
+    """
+    vectorized.check_against_scalar on short matches of a synthetic configuration generated from a fixed seed, so that
+    a change breaking the equivalence of the engines fails the benchmarks. Raises an AssertionError if the mean scores
+    of the engines differ, and returns them otherwise.
+    """
+    scenario = Scenario("equivalence", match_length=EQUIVALENCE_MATCH_LENGTH)
+    rng = np.random.default_rng([BENCHMARK_SEED, zlib.crc32(scenario.name.encode())])
+    with tempfile.TemporaryDirectory() as distribution_dir:
+        distribution_path = os.path.join(distribution_dir, f"{scenario.name}.csv")
+        write_distribution(distribution_path, scenario.grid, rng)
+        config = synthetic_config(scenario, distribution_path, rng)
+        return check_against_scalar(config, EQUIVALENCE_MATCHES, BENCHMARK_SEED, dt)
@@ -1,12 +1,10 @@
 from __future__ import annotations
 from math import exp, log
-from random import random
+from functools import lru_cache
 import numpy as np
-from math import ceil
 import csv
 from typing import List
 from alliance import Alliance, get_alliance_color
-import pygame
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from graphics import GraphicsArea
@@ -30,12 +28,15 @@ DISTRIBUTION_PATH = "default_configs/cargo_dist.csv"
 
 class Cargo:
     CARGO_RADIUS = 0.24
+    __slots__ = ("x", "y", "alliance", "is_selected", "index")
 
-    def __init__(self, x: float, y: float, alliance: Alliance):
+    def __init__(self, x: float, y: float, alliance: Alliance, index: int = None):
         self.x = x
         self.y = y
         self.alliance = alliance
         self.is_selected = False
+        # Slot of the cargo in its pool, if it belongs to one
+        self.index = index
 
     def __str__(self):
         return f"Cargo({self.x}, {self.y}, {self.alliance})"
@@ -75,35 +76,137 @@ def x_func(r: float) -> float:
     return c - a * exp(b * r)
 
 
-def gen_coord_array():
-    return [val for val in range(ceil(FIELD_WIDTH)*ceil(FIELD_HEIGHT))]
-
-
-def get_cargo_dist():
-    raw_vals = []
-    with open(DISTRIBUTION_PATH, "r") as dist_file:
-        reader = csv.reader(dist_file)
-        for row in reader:
-            for val in row:
-                raw_vals.append(int(val))
-    arr = np.array(raw_vals)
-    normalized = (arr - arr.min()) / (arr.max() - arr.min())
-    return normalized / normalized.sum()
-
-
-def get_random_cargo(alliance: Alliance) -> Cargo:
-    sample_index = np.random.choice(gen_coord_array(), p=get_cargo_dist())
-    block_y, block_x = np.unravel_index(sample_index, (ceil(FIELD_HEIGHT), ceil(FIELD_WIDTH)))
-
-    block_width = FIELD_WIDTH / DIST_WIDTH
-    block_height = FIELD_HEIGHT / DIST_HEIGHT
-
-    real_x = block_width * block_x + random() * block_width
-    real_y = block_height * block_y + random() * block_height
-    return Cargo(real_x, real_y, alliance)
-
-
-def initialize_cargo() -> List[Cargo]:
-    return [get_random_cargo(Alliance.RED) for _ in range(NUM_CARGO)] + \
-           [get_random_cargo(Alliance.BLUE) for _ in range(NUM_CARGO)]
-    
\ No newline at end of file
+class CargoDistribution:
+    """
+    A cargo spawn distribution, loaded and validated once, with a precomputed alias table.
+    Every cell of the distribution matrix is a block of the field. Rows go up the field, so the first row of the matrix
+    (the first line of its CSV file) is the bottom of the field, at y = 0, and the last row is its top.
+    """
+
+    def __init__(self, weights: np.ndarray):
+        weights = np.asarray(weights, dtype=float)
+        if weights.ndim != 2 or not weights.size:
+            raise ValueError("Cargo distribution must be a non-empty matrix")
+        if not np.all(np.isfinite(weights)) or weights.min() < 0:
+            raise ValueError("Cargo distribution values must be non-negative numbers")
+        if weights.max() == weights.min():
+            raise ValueError("Cargo distribution must contain at least two different values")
+
+        normalized = (weights - weights.min()) / (weights.max() - weights.min())
+        self.probabilities = (normalized / normalized.sum()).ravel()
+        self.rows, self.columns = weights.shape
+        self.block_width = FIELD_WIDTH / self.columns
+        self.block_height = FIELD_HEIGHT / self.rows
+        self.alias_prob, self.alias = self.__build_alias_table(self.probabilities)
+
+    @staticmethod
+    def __build_alias_table(probabilities: np.ndarray):
+        """
+        Vose's alias method: every cell keeps its own probability mass and the index of a single other cell that fills
+        the rest of it, so sampling takes one uniform number and one comparison.
+        """
+        n = len(probabilities)
+        scaled = probabilities * n
+        alias_prob = np.ones(n)
+        alias = np.arange(n)
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            alias_prob[less] = scaled[less]
+            alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        return alias_prob, alias
+
+    def sample(self, count: int, rng: np.random.Generator):
+        """
+        Draw count random positions on the field from rng, returned as two arrays of x and y coordinates.
+        """
+        u = rng.random(count) * len(self.alias)
+        cells = u.astype(np.int64)
+        cells = np.where(u - cells < self.alias_prob[cells], cells, self.alias[cells])
+        block_y, block_x = np.divmod(cells, self.columns)
+        x = self.block_width * (block_x + rng.random(count))
+        y = self.block_height * (block_y + rng.random(count))
+        return x, y
+
+
+@lru_cache(maxsize=None)
+def load_cargo_distribution(path: str = DISTRIBUTION_PATH) -> CargoDistribution:
+    with open(path, "r") as dist_file:
+        raw_vals = [[int(val) for val in row] for row in csv.reader(dist_file) if row]
+    if len({len(row) for row in raw_vals}) > 1:
+        raise ValueError(f"All rows of the cargo distribution '{path}' must be of the same length")
+    return CargoDistribution(np.array(raw_vals))
+
+
+class CargoPool:
+    """
+    Preallocated cargo, recycled by index through a free list instead of being allocated every time cargo drops.
+    The amount of cargo in a match never changes, so a pool reserved for the whole field never allocates again.
+    """
+
+    def __init__(self, capacity: int = 0):
+        self.cargo: List[Cargo] = []
+        # Stack of the free indices, the lowest on top
+        self.free: List[int] = []
+        self.reserve(capacity)
+
+    @property
+    def capacity(self) -> int:
+        return len(self.cargo)
+
+    def __len__(self):
+        return len(self.cargo) - len(self.free)
+
+    def reserve(self, capacity: int):
+        if capacity <= len(self.cargo):
+            return
+        first = len(self.cargo)
+        self.cargo.extend(Cargo(0.0, 0.0, Alliance.RED, index) for index in range(first, capacity))
+        self.free[:0] = range(capacity - 1, first - 1, -1)
+
+    def acquire(self, x: float, y: float, alliance: Alliance) -> Cargo:
+        if not self.free:
+            self.reserve(max(1, 2 * len(self.cargo)))
+        cargo = self.cargo[self.free.pop()]
+        cargo.x = x
+        cargo.y = y
+        cargo.alliance = alliance
+        cargo.is_selected = False
+        return cargo
+
+    def release(self, cargo: Cargo):
+        self.free.append(cargo.index)
+
+
+class CargoSpawner:
+    """
+    Hands out random cargo positions from a distribution, drawn from rng in batches, as cargo from a pool.
+    Without an rng, positions are drawn from a generator seeded by fresh entropy.
+    """
+    BATCH_SIZE = 64
+
+    def __init__(self, distribution: CargoDistribution = None, pool: CargoPool = None,
+                 rng: np.random.Generator = None):
+        self.distribution = distribution if distribution else load_cargo_distribution()
+        self.pool = pool if pool else CargoPool()
+        self.rng = rng if rng else np.random.default_rng()
+        self.xs = []
+        self.ys = []
+        self.next_idx = 0
+
+    def spawn(self, alliance: Alliance) -> Cargo:
+        if self.next_idx == len(self.xs):
+            xs, ys = self.distribution.sample(self.BATCH_SIZE, self.rng)
+            self.xs, self.ys = xs.tolist(), ys.tolist()
+            self.next_idx = 0
+        cargo = self.pool.acquire(self.xs[self.next_idx], self.ys[self.next_idx], alliance)
+        self.next_idx += 1
+        return cargo
+
+
+def initialize_cargo(spawner: CargoSpawner, num_cargo: int = NUM_CARGO) -> List[Cargo]:
+    return [spawner.spawn(Alliance.RED) for _ in range(num_cargo)] + \
+           [spawner.spawn(Alliance.BLUE) for _ in range(num_cargo)]
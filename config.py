@@ -1,8 +1,13 @@
 import json
+from typing import Union
+import numpy as np
 from alliance import Alliance
 from robot import Robot
 from field import Field
 from game import ScoreBoard
+from cargo import CargoSpawner, load_cargo_distribution, DISTRIBUTION_PATH, NUM_CARGO
+from assignment import ASSIGNMENTS, create_assignment
+from spatial import Congestion
 
 
 class ConfigParsingException(Exception):
@@ -15,29 +20,89 @@ def safe_dict_lookup(dictionary: dict, key: str):
     return dictionary[key]
 
 
-def parse_config(config_path: str):
+def load_config(config_path: str) -> dict:
     with open(config_path, "r") as config_file:
-        data = json.load(config_file)
+        return json.load(config_file)
 
-    # Robots
+
+def normalize_config(data: dict) -> dict:
+    """
+    A canonical copy of a configuration: every value is validated and converted to its type, and optional values are
+    filled in with their defaults. Equal configurations have equal normalized forms.
+    """
     robots = []
     for robot in safe_dict_lookup(data, "robots"):
         starting_pos = safe_dict_lookup(robot, "starting_position")
-        starting_pos = (float(starting_pos[0]), float(starting_pos[1]))
-        collect_time = float(safe_dict_lookup(robot, "collect_time"))
-        shoot_time = float(safe_dict_lookup(robot, "shoot_time"))
-        velocity = float(safe_dict_lookup(robot, "velocity"))
-        accuracy = float(safe_dict_lookup(robot, "accuracy"))
         alliance = safe_dict_lookup(robot, "alliance")
         if alliance not in ["RED", "BLUE"]:
             raise ConfigParsingException("Alliance value must be either 'RED' or 'BLUE'")
-        alliance = Alliance(alliance)
-        robots.append(Robot(starting_pos, collect_time, shoot_time, velocity, accuracy, alliance))
+        robots.append({
+            "starting_position": [float(starting_pos[0]), float(starting_pos[1])],
+            "collect_time": float(safe_dict_lookup(robot, "collect_time")),
+            "shoot_time": float(safe_dict_lookup(robot, "shoot_time")),
+            "velocity": float(safe_dict_lookup(robot, "velocity")),
+            "accuracy": float(safe_dict_lookup(robot, "accuracy")),
+            "alliance": alliance,
+        })
 
     field_config = safe_dict_lookup(data, "field")
-    field = Field(ScoreBoard(), float(safe_dict_lookup(field_config, "cargo_hub_timeout")))
+    field = {
+        "cargo_hub_timeout": float(safe_dict_lookup(field_config, "cargo_hub_timeout")),
+        "match_length": float(safe_dict_lookup(field_config, "match_length")),
+        "cargo_distribution": str(field_config.get("cargo_distribution", DISTRIBUTION_PATH)),
+        "num_cargo": int(field_config.get("num_cargo", NUM_CARGO)),
+        "cargo_assignment": str(field_config.get("cargo_assignment", "nearest")),
+        "congestion_penalty": float(field_config.get("congestion_penalty", 0.0)),
+        "congestion_radius": float(field_config.get("congestion_radius", 1.0)),
+    }
+    if field["num_cargo"] < 1:
+        raise ConfigParsingException("Every alliance must have at least one cargo")
+    if field["congestion_penalty"] < 0 or field["congestion_radius"] <= 0:
+        raise ConfigParsingException("Congestion penalty must not be negative and its radius must be positive")
+    if field["cargo_assignment"] not in ASSIGNMENTS:
+        raise ConfigParsingException(f"Cargo assignment must be one of {', '.join(ASSIGNMENTS)}")
+    return {"field": field, "robots": robots}
+
+
+def match_streams(seed: Union[int, np.random.SeedSequence, None], count: int):
+    """
+    Independent random generators spawned from a match's seed, or from fresh entropy if no seed is given.
+    """
+    seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    return [np.random.default_rng(child) for child in seed_sequence.spawn(count)]
+
+
+def build_match(data: dict, seed: Union[int, np.random.SeedSequence] = None):
+    return build_normalized_match(normalize_config(data), seed)
+
+
+def build_normalized_match(data: dict, seed: Union[int, np.random.SeedSequence] = None):
+    """
+    Build a match from a configuration which was already normalized, skipping its validation.
+    The cargo spawner and every robot draw their random numbers from their own stream spawned from seed.
+    """
+    spawner_rng, *robot_rngs = match_streams(seed, 1 + len(data["robots"]))
+    robots = [Robot(tuple(robot["starting_position"]), robot["collect_time"], robot["shoot_time"], robot["velocity"],
+                    robot["accuracy"], Alliance(robot["alliance"]), rng)
+              for robot, rng in zip(data["robots"], robot_rngs)]
+
+    field_config = data["field"]
+    distribution_path = field_config["cargo_distribution"]
+    try:
+        distribution = load_cargo_distribution(distribution_path)
+    except (OSError, ValueError) as e:
+        raise ConfigParsingException(f"Invalid cargo distribution '{distribution_path}': {e}")
+    field = Field(ScoreBoard(), field_config["cargo_hub_timeout"], CargoSpawner(distribution, rng=spawner_rng),
+                  field_config["num_cargo"], create_assignment(field_config["cargo_assignment"]))
+    if field_config["congestion_penalty"]:
+        field.congestion = Congestion(field_config["congestion_penalty"], field_config["congestion_radius"])
+        field.congestion.track(robots)
+
+    return field, robots, field_config["match_length"]
+
 
-    return field, robots, float(safe_dict_lookup(field_config, "match_length"))
+def parse_config(config_path: str, seed: Union[int, np.random.SeedSequence] = None):
+    return build_match(load_config(config_path), seed)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,265 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from math import sqrt
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+from alliance import Alliance
+from batch import aggregate_batch
+from cargo import load_cargo_distribution
+from config import load_config, normalize_config
+from sweep import distribution_digest, CACHE_DIR, CACHE_VERSION
+
+DISTANCE_SAMPLES = 4096
+# Largest number of sampled distances held at once while building a distance table
+MAX_TABLE_SIZE = 2 ** 22
+FIXED_POINT_ITERATIONS = 30
+# Free cargo difference below which the fixed point is considered found
+FIXED_POINT_TOLERANCE = 1e-3
+CALIBRATION_CONFIGS = 12
+CALIBRATION_MATCHES = 200
+# Calibrated configurations scale every robot parameter by a random factor in this range
+CALIBRATION_SPREAD = 0.4
+TRAVEL_FACTORS = np.linspace(0.5, 3.0, 126)
+# Bump whenever a change to the estimator invalidates the factors calibrated before it
+CALIBRATION_VERSION = 1
+
+
+@lru_cache(maxsize=None)
+def nearest_distance_table(distribution_path: str, max_cargo: int) -> Tuple[List[float], List[float]]:
+    """
+    The mean and second moment of the distance from a point drawn from the cargo distribution to the nearest of k
+    cargo drawn from it, for every k from 1 to max_cargo (index k - 1).
+    Robots shoot where they collected their cargo, so this is the distance driven between two collections.
+    """
+    distribution = load_cargo_distribution(distribution_path)
+    rng = np.random.default_rng(0)
+    samples = max(256, min(DISTANCE_SAMPLES, MAX_TABLE_SIZE // max_cargo))
+    origin_x, origin_y = distribution.sample(samples, rng)
+    cargo_x, cargo_y = distribution.sample(samples * max_cargo, rng)
+    distances = np.hypot(cargo_x.reshape(samples, max_cargo) - origin_x[:, None],
+                         cargo_y.reshape(samples, max_cargo) - origin_y[:, None])
+    nearest = np.minimum.accumulate(distances, axis=1)
+    return nearest.mean(axis=0).tolist(), (nearest ** 2).mean(axis=0).tolist()
+
+
+class Estimator:
+    """
+    Closed-form prediction of an alliance's score from its robots' cycle times.
+
+    Every robot repeats a cycle of driving to the nearest free cargo, collecting and shooting it. The expected drive
+    (and its variance) comes from the nearest-cargo distance under the cargo distribution, given how much cargo is
+    free on the floor, which is in turn the alliance's cargo minus the cargo held by its robots and recirculating through
+    the hub. When the hub holds most of the cargo, the alliance is limited by the cargo instead of by its robots.
+    Scores follow from renewal theory: a robot with cycle mean m and variance s^2 completes about L / m cycles in a match
+    of length L, with a variance of L * s^2 / m^3.
+    The calibration factors correct for what the model leaves out (driving around the hub, competition for the same
+    cargo, the first cycle starting away from cargo).
+    """
+
+    def __init__(self, field_config: dict, travel_factor: float = 1.0, variance_factor: float = 1.0):
+        self.cargo_hub_timeout = field_config["cargo_hub_timeout"]
+        self.match_length = field_config["match_length"]
+        self.num_cargo = field_config["num_cargo"]
+        self.mean_distance, self.distance_moment = nearest_distance_table(field_config["cargo_distribution"],
+                                                                         self.num_cargo)
+        self.travel_factor = travel_factor
+        self.variance_factor = variance_factor
+
+    def estimate(self, robots: List[dict]) -> Dict[str, Dict[str, float]]:
+        """
+        Expected score and its standard deviation for every alliance, from normalized robot configurations.
+        """
+        result = {}
+        for alliance in (Alliance.RED, Alliance.BLUE):
+            params = [(robot["collect_time"], robot["shoot_time"], robot["velocity"], robot["accuracy"])
+                      for robot in robots if robot["alliance"] == alliance.value]
+            mean, variance = self.estimate_alliance(params)
+            result[alliance.value] = {"mean": mean, "std": sqrt(variance)}
+        return result
+
+    def estimate_alliance(self, robots: List[Tuple[float, float, float, float]]) -> Tuple[float, float]:
+        """
+        Expected score and its variance for an alliance of (collect_time, shoot_time, velocity, accuracy) robots.
+        """
+        if not robots:
+            return 0.0, 0.0
+        # The free cargo is where it equals the cargo left on the floor by the flow it allows, which grows with it.
+        # Their difference is bracketed by its values at 1 and all cargo, and found by the Illinois method.
+        low, high = 1.0, float(self.num_cargo)
+        low_excess, high_excess = low - self.__flow(robots, low)[2], high - self.__flow(robots, high)[2]
+        free_cargo, side = high, 0
+        for _ in range(FIXED_POINT_ITERATIONS):
+            if high_excess - low_excess < FIXED_POINT_TOLERANCE:
+                break
+            free_cargo = (low * high_excess - high * low_excess) / (high_excess - low_excess)
+            excess = free_cargo - self.__flow(robots, free_cargo)[2]
+            if abs(excess) < FIXED_POINT_TOLERANCE:
+                break
+            if excess > 0:
+                high, high_excess = free_cargo, excess
+                if side < 0:
+                    low_excess /= 2
+                side = -1
+            else:
+                low, low_excess = free_cargo, excess
+                if side > 0:
+                    high_excess /= 2
+                side = 1
+        rate, robot_rate, _ = self.__flow(robots, free_cargo)
+
+        distance, moment = self.__distance(free_cargo)
+        distance_variance = max(moment - distance * distance, 0.0)
+        utilization = rate / robot_rate
+        mean = variance = 0.0
+        for collect, shoot, velocity, accuracy in robots:
+            cycle = (distance / velocity + collect + shoot) / utilization
+            cycle_variance = distance_variance / (velocity * velocity)
+            shots = self.match_length / cycle
+            shots_variance = self.match_length * cycle_variance / cycle ** 3
+            mean += 2 * accuracy * shots
+            variance += 4 * (accuracy * accuracy * shots_variance + accuracy * (1 - accuracy) * shots)
+        return mean, variance * self.variance_factor
+
+    def __flow(self, robots: List[Tuple[float, float, float, float]], free_cargo: float) -> Tuple[float, float, float]:
+        """
+        The alliance's shot rate and its rate if it were never short of cargo, when free_cargo cargo are on the floor,
+        and the cargo that would then be left on the floor.
+        """
+        distance, _ = self.__distance(free_cargo)
+        robot_rate = hit_rate = 0.0
+        for collect, shoot, velocity, accuracy in robots:
+            cycle = distance / velocity + collect + shoot
+            robot_rate += 1 / cycle
+            hit_rate += accuracy / cycle
+        hit_rate /= robot_rate
+        # Every cargo spends a cycle with a robot and, when scored, the hub's timeout away from the floor
+        held_per_rate = len(robots) / robot_rate + hit_rate * self.cargo_hub_timeout
+        rate = min(robot_rate, self.num_cargo / held_per_rate)
+        return rate, robot_rate, min(max(self.num_cargo - rate * held_per_rate, 1.0), self.num_cargo)
+
+    def __distance(self, free_cargo: float) -> Tuple[float, float]:
+        """
+        The travel factor scaled mean and second moment of the drive distance, interpolated between whole cargo.
+        """
+        low = min(int(free_cargo), self.num_cargo)
+        high = min(low + 1, self.num_cargo)
+        weight = free_cargo - low
+        mean = self.mean_distance[low - 1] * (1 - weight) + self.mean_distance[high - 1] * weight
+        moment = self.distance_moment[low - 1] * (1 - weight) + self.distance_moment[high - 1] * weight
+        return mean * self.travel_factor, moment * self.travel_factor ** 2
+
+
+def calibration_key(field_config: dict) -> str:
+    """
+    Key of a field's calibration: its normalized configuration, the contents of its cargo distribution, and the
+    versions of the estimator and of the simulation it was calibrated against.
+    """
+    key = {"version": CALIBRATION_VERSION, "simulation_version": CACHE_VERSION, "field": field_config,
+           "distribution": distribution_digest(field_config["cargo_distribution"])}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def calibration_path(field_config: dict, cache_dir: str = CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"estimator_{calibration_key(field_config)}.json")
+
+
+def load_calibration(field_config: dict, cache_dir: str = CACHE_DIR) -> Optional[dict]:
+    path = calibration_path(field_config, cache_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as calibration_file:
+        return json.load(calibration_file)
+
+
+def create_estimator(config: Union[str, dict], cache_dir: str = CACHE_DIR) -> Estimator:
+    """
+    An estimator for the configuration's field, with the cached calibration of that field if there is one.
+    """
+    if isinstance(config, str):
+        config = load_config(config)
+    field_config = normalize_config(config)["field"]
+    calibration = load_calibration(field_config, cache_dir) if cache_dir else None
+    if calibration:
+        return Estimator(field_config, calibration["travel_factor"], calibration["variance_factor"])
+    return Estimator(field_config)
+
+
+def perturbed_configs(config: dict, count: int, seed: int) -> List[dict]:
+    """
+    The configuration itself followed by count - 1 variations of its robots, for calibrating over a range of robots.
+    """
+    rng = np.random.default_rng(seed)
+    configs = [config]
+    for _ in range(count - 1):
+        robots = []
+        for robot in config["robots"]:
+            scales = rng.uniform(1 - CALIBRATION_SPREAD, 1 + CALIBRATION_SPREAD, size=4)
+            robots.append(dict(robot, collect_time=robot["collect_time"] * scales[0],
+                               shoot_time=robot["shoot_time"] * scales[1], velocity=robot["velocity"] * scales[2],
+                               accuracy=float(min(max(robot["accuracy"] * scales[3], 0.1), 1.0))))
+        configs.append({"field": config["field"], "robots": robots})
+    return configs
+
+
+def estimation_errors(estimator: Estimator, configs: List[dict], summaries: List[dict]) -> dict:
+    """
+    Mean and largest relative errors of the estimated score means and standard deviations against simulated ones.
+    """
+    mean_errors, std_errors = [], []
+    for config, summary in zip(configs, summaries):
+        estimate = estimator.estimate(config["robots"])
+        for alliance in (Alliance.RED.value, Alliance.BLUE.value):
+            simulated = summary[alliance]
+            if simulated["mean"]:
+                mean_errors.append(abs(estimate[alliance]["mean"] - simulated["mean"]) / simulated["mean"])
+            if simulated["std"]:
+                std_errors.append(abs(estimate[alliance]["std"] - simulated["std"]) / simulated["std"])
+    return {"mean_error": float(np.mean(mean_errors)) if mean_errors else 0.0,
+            "max_mean_error": float(np.max(mean_errors)) if mean_errors else 0.0,
+            "std_error": float(np.mean(std_errors)) if std_errors else 0.0,
+            "max_std_error": float(np.max(std_errors)) if std_errors else 0.0}
+
+
+def calibrate(config: Union[str, dict], num_configs: int = CALIBRATION_CONFIGS,
+              num_matches: int = CALIBRATION_MATCHES, seed: int = 0, workers: int = None,
+              cache_dir: str = CACHE_DIR) -> dict:
+    """
+    Fit the estimator's correction factors for the configuration's field against simulated matches of the
+    configuration and of variations of its robots, and cache them. Returns the factors and the estimation errors
+    after the fit.
+    """
+    if isinstance(config, str):
+        config = load_config(config)
+    config = normalize_config(config)
+    field_config = config["field"]
+    # Congestion is only supported by the tick engine
+    engine = "tick" if field_config["congestion_penalty"] else "event"
+    configs = perturbed_configs(config, num_configs, seed)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        summaries = [aggregate_batch(sample, num_matches, seed, workers, engine=engine, executor=executor).summary()
+                     for sample in configs]
+
+    def mean_error(travel_factor: float) -> float:
+        return estimation_errors(Estimator(field_config, travel_factor), configs, summaries)["mean_error"]
+
+    travel_factor = float(min(TRAVEL_FACTORS, key=mean_error))
+    estimator = Estimator(field_config, travel_factor)
+    ratios = []
+    for sample, summary in zip(configs, summaries):
+        estimate = estimator.estimate(sample["robots"])
+        ratios += [summary[alliance]["std"] ** 2 / estimate[alliance]["std"] ** 2
+                   for alliance in (Alliance.RED.value, Alliance.BLUE.value) if estimate[alliance]["std"]]
+    variance_factor = float(np.median(ratios)) if ratios else 1.0
+
+    calibration = {"travel_factor": travel_factor, "variance_factor": variance_factor, "configs": num_configs,
+                   "matches": num_matches, "engine": engine}
+    calibration.update(estimation_errors(Estimator(field_config, travel_factor, variance_factor), configs, summaries))
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(calibration_path(field_config, cache_dir), "w") as calibration_file:
+            json.dump(calibration, calibration_file, indent=2)
+    return calibration
@@ -0,0 +1,109 @@
+from __future__ import annotations
+from heapq import heappush, heappop
+from itertools import count
+from typing import Dict, List, TYPE_CHECKING
+from alliance import Alliance
+from robot import Robot
+if TYPE_CHECKING:
+    from field import Field
+
+
+class EventSimulation:
+    """
+    Discrete-event alternative to ticking the match every frame.
+    Every robot action and every cargo in the hub has a known completion time, so instead of polling them the
+    simulation keeps a priority queue of timestamped events and jumps straight from one event to the next.
+    """
+    MATCH_END, ROBOT_ACTION, PATH_SEGMENT, HUB_RELEASE, ASSIGN = range(5)
+
+    def __init__(self, field: Field, robots: List[Robot], match_length: float):
+        if field.congestion:
+            # Congestion changes with every move of every robot, so action completion times are not known in advance
+            raise ValueError("The event engine does not support congestion")
+        self.field = field
+        self.robots = robots
+        self.match_length = match_length
+        self.time = 0.0
+        self.queue = []
+        self.sequence = count()
+        # Robots that could not select cargo, waiting for cargo of their alliance to reach the floor
+        self.waiting: Dict[Alliance, List[Robot]] = {Alliance.RED: [], Alliance.BLUE: []}
+        # Batched assignment policies hand out cargo in an ASSIGN event after all other events of the same time
+        self.assign_pending = False
+
+    def schedule(self, time: float, kind: int, payload=None):
+        # The sequence number breaks ties between simultaneous events in the order they were scheduled
+        heappush(self.queue, (time, next(self.sequence), kind, payload))
+
+    def run(self):
+        self.schedule(self.match_length, self.MATCH_END)
+        for robot in self.robots:
+            self.__start_action(robot)
+
+        while self.queue:
+            time, _, kind, payload = heappop(self.queue)
+            self.field.score_keeper.update(time - self.time)
+            self.time = time
+            if kind == self.MATCH_END:
+                break
+            # Every event first brings the hub to its time, so HUB_RELEASE events need no handling of their own
+            if self.field.release_hub_cargo(time):
+                self.__wake_robots(Alliance.RED)
+                self.__wake_robots(Alliance.BLUE)
+            if kind == self.ROBOT_ACTION:
+                self.__finish_action(payload)
+            elif kind == self.PATH_SEGMENT:
+                self.__finish_segment(payload)
+            elif kind == self.ASSIGN:
+                self.__assign()
+
+    def __start_action(self, robot: Robot):
+        if robot.current_action == Robot.SELECT:
+            robot.select_cargo(self.field, 0.0)
+            if not robot.selected_cargo:
+                self.waiting[robot.alliance].append(robot)
+                if self.field.assignment.batched and not self.assign_pending:
+                    self.assign_pending = True
+                    self.schedule(self.time, self.ASSIGN)
+                return
+        if robot.current_action == Robot.DRIVE:
+            self.schedule(self.time + robot.path.distance_to_next_point() / robot.velocity, self.PATH_SEGMENT, robot)
+        else:
+            self.schedule(self.time + robot.action_duration(), self.ROBOT_ACTION, robot)
+
+    def __finish_segment(self, robot: Robot):
+        robot.path.skip_to_next_point()
+        robot.x, robot.y = robot.path.x, robot.path.y
+        if robot.path.done:
+            self.__finish_action(robot)
+        else:
+            self.schedule(self.time + robot.path.distance_to_next_point() / robot.velocity, self.PATH_SEGMENT, robot)
+
+    def __finish_action(self, robot: Robot):
+        shot = robot.current_action == Robot.SHOOT
+        shots_made = robot.shots_made
+        robot.finish_action(self.field)
+        if shot:
+            if robot.shots_made > shots_made:
+                self.schedule(self.field.hub.cargo_timeouts[robot.alliance][-1], self.HUB_RELEASE)
+            else:
+                # A missed shot puts the cargo straight back on the floor
+                self.__wake_robots(robot.alliance)
+        self.__start_action(robot)
+
+    def __assign(self):
+        self.assign_pending = False
+        waiting = self.waiting[Alliance.RED] + self.waiting[Alliance.BLUE]
+        self.field.assign_cargo(waiting)
+        # Robots left without cargo keep waiting, without asking for another assignment until they are woken up
+        for alliance in (Alliance.RED, Alliance.BLUE):
+            self.waiting[alliance] = [robot for robot in self.waiting[alliance] if not robot.selected_cargo]
+        for robot in waiting:
+            if robot.selected_cargo:
+                self.__start_action(robot)
+
+    def __wake_robots(self, alliance: Alliance):
+        waiting = self.waiting[alliance]
+        self.waiting[alliance] = []
+        for robot in waiting:
+            self.__start_action(robot)
@@ -1,12 +1,15 @@
 from __future__ import annotations
 from alliance import Alliance, get_alliance_color
-from cargo import initialize_cargo, get_random_cargo
-from math import sqrt
-from typing import Dict, TYPE_CHECKING
-from cargo import FIELD_WIDTH, FIELD_HEIGHT, Cargo
+from cargo import initialize_cargo, CargoSpawner
+from collections import deque
+from typing import Callable, List, Optional, TYPE_CHECKING
+from cargo import FIELD_WIDTH, FIELD_HEIGHT, NUM_CARGO, Cargo
+from spatial import CargoIndex, Congestion
+from assignment import NearestAssignment
 if TYPE_CHECKING:
     from cargo import Cargo
     from game import ScoreBoard
+    from robot import Robot
     from graphics import GraphicsArea
 
 
@@ -16,30 +19,29 @@ class Hub:
 
     def __init__(self, cargo_hub_timeout: float):
         self.cargo_hub_timeout = cargo_hub_timeout
-        self.cargo_timeouts = {Alliance.RED: [], Alliance.BLUE: []}
+        self.time = 0.0
+        # Times at which the cargo in the hub falls back to the field. The timeout is the same for all cargo, so every
+        # queue is sorted and cargo always leaves from its head.
+        self.cargo_timeouts = {Alliance.RED: deque(), Alliance.BLUE: deque()}
 
     def add_cargo(self, alliance: Alliance):
-        self.cargo_timeouts[alliance].append(self.cargo_hub_timeout)
+        self.cargo_timeouts[alliance].append(self.time + self.cargo_hub_timeout)
 
-    def get_fallen_cargo(self, dt: float) -> Dict[Alliance, int]:
-        return {Alliance.RED: self.__get_fallen_cargo(dt, Alliance.RED),
-                Alliance.BLUE: self.__get_fallen_cargo(dt, Alliance.BLUE)}
-
-    def __get_fallen_cargo(self, dt: float, alliance: Alliance) -> int:
-        new_timeouts = []
+    def release_fallen_cargo(self, alliance: Alliance) -> int:
+        """
+        Remove the alliance's cargo whose timeout has passed by the hub's current time, and return how much was removed.
+        """
+        timeouts = self.cargo_timeouts[alliance]
         result = 0
-        for timeout in self.cargo_timeouts[alliance]:
-            timeout -= dt
-            if timeout <= 0.0:
-                result += 1
-            else:
-                new_timeouts.append(timeout)
-        self.cargo_timeouts[alliance] = new_timeouts
+        while timeouts and timeouts[0] <= self.time:
+            timeouts.popleft()
+            result += 1
         return result
 
-    def draw(self, graphics: GraphicsArea):
+    def draw_background(self, graphics: GraphicsArea):
         graphics.draw_rect("grey", (self.HUB_TOP_LEFT[0], self.HUB_TOP_LEFT[1], self.HUB_DIMENSION, self.HUB_DIMENSION))
 
+    def draw(self, graphics: GraphicsArea):
         cursor = [self.HUB_TOP_LEFT[0] + Cargo.CARGO_RADIUS, self.HUB_TOP_LEFT[1] + Cargo.CARGO_RADIUS]
         for i in range(len(self.cargo_timeouts[Alliance.BLUE])):
             graphics.draw_circle(get_alliance_color(Alliance.BLUE), cursor, Cargo.CARGO_RADIUS)
@@ -59,32 +61,80 @@ class Hub:
 
 
 class Field:
-    def __init__(self, score_keeper: ScoreBoard, cargo_hub_timeout: float):
-        self.floor_cargo = initialize_cargo()
-        self.selected_cargo = []
+    def __init__(self, score_keeper: ScoreBoard, cargo_hub_timeout: float, spawner: CargoSpawner = None,
+                 num_cargo: int = NUM_CARGO, assignment: NearestAssignment = None, congestion: Congestion = None):
+        self.spawner = spawner if spawner else CargoSpawner()
+        # Policy deciding which cargo every robot goes for
+        self.assignment = assignment if assignment else NearestAssignment()
+        # Slowdown of robots near each other, None when disabled
+        self.congestion = congestion
+        self.num_cargo = num_cargo
+        # Cargo leaves the pool when it drops on the floor and returns to it when collected
+        self.cargo_pool = self.spawner.pool
+        self.cargo_pool.reserve(2 * num_cargo)
+        self.floor_cargo = set()
+        # Floor cargo that was not selected yet, per alliance
+        self.selectable_cargo = {Alliance.RED: CargoIndex(), Alliance.BLUE: CargoIndex()}
+        for cargo in initialize_cargo(self.spawner, num_cargo):
+            self.__drop_cargo(cargo)
         self.score_keeper = score_keeper
         self.hub = Hub(cargo_hub_timeout)
 
     def update_field(self, dt):
-        for alliance, fallen_cargo in self.hub.get_fallen_cargo(dt).items():
-            for _ in range(fallen_cargo):
-                self.floor_cargo.append(get_random_cargo(alliance))
+        self.release_hub_cargo(self.hub.time + dt)
+
+    def release_hub_cargo(self, time: float) -> bool:
+        """
+        Advance the hub's clock to time and drop the cargo that fell out of it back onto the floor.
+        Returns whether any cargo fell.
+        """
+        self.hub.time = time
+        released = False
+        for alliance in (Alliance.RED, Alliance.BLUE):
+            for _ in range(self.hub.release_fallen_cargo(alliance)):
+                self.__drop_cargo(self.spawner.spawn(alliance))
+                released = True
+        return released
 
     def shoot_cargo(self, alliance: Alliance):
         self.hub.add_cargo(alliance)
         self.score_keeper.cargo_to_top(alliance)
 
     def miss_cargo(self, alliance: Alliance):
-        self.floor_cargo.append(get_random_cargo(alliance))
-
-    def select_nearest_cargo(self, alliance: Alliance, position) -> Cargo:
-        chosen = min([cargo for cargo in self.floor_cargo if cargo.alliance == alliance and not cargo.is_selected],
-                     key=lambda cargo: sqrt((cargo.x-position[0])**2 + (cargo.y-position[1])**2))
-        chosen.is_selected = True
+        self.__drop_cargo(self.spawner.spawn(alliance))
+
+    def select_nearest_cargo(self, alliance: Alliance, position, metric: Callable = None) -> Optional[Cargo]:
+        """
+        Select the nearest cargo of the alliance which was not selected yet, or return None if there is none.
+        metric(position, cargo) may replace the euclidean distance, e.g. with the travel distance around the hub, as long
+        as it is never smaller than the euclidean distance.
+        """
+        chosen = self.selectable_cargo[alliance].nearest(position, metric)
+        if chosen:
+            self.select_cargo(chosen)
         return chosen
 
+    def select_cargo(self, cargo: Cargo):
+        cargo.is_selected = True
+        self.selectable_cargo[cargo.alliance].remove(cargo)
+
+    def assign_cargo(self, robots: List[Robot]):
+        """
+        Let the assignment policy hand out cargo to the robots waiting for it, all at once.
+        """
+        self.assignment.assign(self, robots)
+
     def collect_cargo(self, to_collect: Cargo):
         self.floor_cargo.remove(to_collect)
+        self.cargo_pool.release(to_collect)
+
+    def __drop_cargo(self, cargo: Cargo):
+        self.floor_cargo.add(cargo)
+        self.selectable_cargo[cargo.alliance].add(cargo)
+
+    def draw_background(self, graphics: GraphicsArea):
+        graphics.fill("white")
+        self.hub.draw_background(graphics)
 
     def draw(self, graphics: GraphicsArea):
         for cargo in self.floor_cargo:
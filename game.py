@@ -16,14 +16,15 @@ class ScoreBoard:
     def update(self, dt):
         self.time += dt
 
-    def draw(self, graphics: GraphicsArea):
+    def draw_background(self, graphics: GraphicsArea):
         graphics.draw_rect(get_alliance_color(Alliance.BLUE), (0, 0, graphics.real_width / 3, graphics.real_height))
-        graphics.draw_text(str(self.score[Alliance.BLUE]), (graphics.real_width / 6, graphics.real_height * 3/4), 40, "white")
         graphics.draw_rect("green", (graphics.real_width / 3, 0, graphics.real_width / 3,
                                       graphics.real_height))
-        graphics.draw_text(str(int(self.time)), (graphics.real_width / 2, graphics.real_height * 3 / 4),
-                           40, "white")
         graphics.draw_rect(get_alliance_color(Alliance.RED), (2 * graphics.real_width / 3, 0, graphics.real_width / 3,
                                                               graphics.real_height))
-        graphics.draw_text(str(self.score[Alliance.RED]), (graphics.real_width * 5 / 6, graphics.real_height * 3/4), 40, "white")
 
+    def draw(self, graphics: GraphicsArea):
+        graphics.draw_text(str(self.score[Alliance.BLUE]), (graphics.real_width / 6, graphics.real_height * 3/4), 40, "white")
+        graphics.draw_text(str(int(self.time)), (graphics.real_width / 2, graphics.real_height * 3 / 4),
+                           40, "white")
+        graphics.draw_text(str(self.score[Alliance.RED]), (graphics.real_width * 5 / 6, graphics.real_height * 3/4), 40, "white")
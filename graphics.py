@@ -1,10 +1,22 @@
 from __future__ import annotations
 import pygame
-from typing import Tuple, TYPE_CHECKING
+from functools import lru_cache
+from typing import List, Tuple, TYPE_CHECKING
 if TYPE_CHECKING:
+    from pygame.rect import Rect
     from pygame.surface import Surface
 
 
+@lru_cache(maxsize=None)
+def get_font(size: int) -> pygame.font.Font:
+    return pygame.font.Font(pygame.font.get_default_font(), size)
+
+
+@lru_cache(maxsize=256)
+def render_text(text: str, size: int, color) -> Surface:
+    return get_font(size).render(text, True, color)
+
+
 class GraphicsArea:
 
     def __init__(self, screen: Surface, top_left: Tuple[int, int], pixel_width: int, pixel_height: int,
@@ -15,13 +27,25 @@ class GraphicsArea:
         self.real_width = real_width if real_width else pixel_width
         self.height = pixel_height
         self.real_height = real_height if real_height else pixel_height
+        # Screen areas drawn on since the last call to take_dirty_rects
+        self.dirty_rects: List[Rect] = []
+
+    def on_surface(self, surface: Surface) -> GraphicsArea:
+        """
+        The same area, drawing on another surface of the same size as the screen.
+        """
+        return GraphicsArea(surface, self.top_left, self.width, self.height, self.real_width, self.real_height)
+
+    def take_dirty_rects(self) -> List[Rect]:
+        rects, self.dirty_rects = self.dirty_rects, []
+        return rects
 
     def draw_circle(self, color, center, radius, width=0):
         if center[0] > self.width or center[1] > self.height:
             raise ValueError("Invalid circle coordinate")
 
-        pygame.draw.circle(self.screen, color, self.__convert_point(center), self.__convert_dimensions(radius, 0)[0],
-                           width)
+        self.dirty_rects.append(pygame.draw.circle(self.screen, color, self.__convert_point(center),
+                                                   self.__convert_dimensions(radius, 0)[0], width))
 
     def draw_rect(self, color, rect):
         left, top, width, height = rect
@@ -30,17 +54,19 @@ class GraphicsArea:
         new_left, new_top = self.__convert_point((left, top))
         new_width, new_height = self.__convert_dimensions(width, height)
 
-        pygame.draw.rect(self.screen, color, (new_left, new_top-new_height, new_width, new_height))
+        self.dirty_rects.append(pygame.draw.rect(self.screen, color,
+                                                 (new_left, new_top-new_height, new_width, new_height)))
 
     def fill(self, color):
-        pygame.draw.rect(self.screen, color, (self.top_left[0], self.top_left[1], self.width, self.height))
+        self.dirty_rects.append(pygame.draw.rect(self.screen, color,
+                                                 (self.top_left[0], self.top_left[1], self.width, self.height)))
 
     def draw_text(self, text: str, pos, size, color):
-        font = pygame.font.Font(pygame.font.get_default_font(), size)
-        self.screen.blit(font.render(text, True, color), self.__convert_point(pos))
+        self.dirty_rects.append(self.screen.blit(render_text(text, size, color), self.__convert_point(pos)))
 
     def draw_line(self, color, start_pos, end_pos, width=1):
-        pygame.draw.line(self.screen, color, self.__convert_point(start_pos), self.__convert_point(end_pos), width)
+        self.dirty_rects.append(pygame.draw.line(self.screen, color, self.__convert_point(start_pos),
+                                                 self.__convert_point(end_pos), width))
 
     def __convert_point(self, point):
         x, y = point
@@ -50,3 +76,44 @@ class GraphicsArea:
 
     def __convert_dimensions(self, width, height):
         return int((width / self.real_width) * self.width), int((height / self.real_height) * self.height)
+
+
+class Renderer:
+    """
+    Retained-mode rendering: static layers are drawn once onto a background surface, and every frame only the parts of
+    the screen that changed since the previous frame are restored from it, redrawn and pushed to the display.
+    """
+
+    def __init__(self, screen: Surface, areas: List[GraphicsArea]):
+        self.screen = screen
+        self.areas = areas
+        self.background = pygame.Surface(screen.get_size())
+        self.previous_rects: List[Rect] = []
+
+    def background_areas(self) -> List[GraphicsArea]:
+        """
+        The renderer's areas, drawing on the background surface instead of the screen.
+        """
+        return [area.on_surface(self.background) for area in self.areas]
+
+    def show_background(self):
+        self.screen.blit(self.background, (0, 0))
+        pygame.display.flip()
+        for area in self.areas:
+            area.take_dirty_rects()
+        self.previous_rects = []
+
+    def begin_frame(self):
+        """
+        Erase everything drawn in the previous frame.
+        """
+        for rect in self.previous_rects:
+            self.screen.blit(self.background, rect, rect)
+
+    def end_frame(self):
+        """
+        Update the parts of the display drawn on in this frame or erased from the previous one.
+        """
+        rects = [rect for area in self.areas for rect in area.take_dirty_rects()]
+        pygame.display.update(self.previous_rects + rects)
+        self.previous_rects = rects
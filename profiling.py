@@ -0,0 +1,134 @@
+from __future__ import annotations
+import json
+import sys
+import time
+from functools import wraps
+from typing import Callable, Dict, List, Optional
+
+# (module, class or None for module functions, attribute, timed phase or None, event counter or None)
+INSTRUMENTED = (
+    ("robot", "Robot", "select_cargo", "robot.select_cargo", None),
+    ("robot", "Robot", "drive", "robot.drive", None),
+    ("robot", "Robot", "collect_ball", "robot.collect_ball", None),
+    ("robot", "Robot", "shoot_ball", "robot.shoot_ball", None),
+    ("robot", None, "plan_path", "plan_path", None),
+    ("robot", "Robot", "finish_action", "robot.finish_action", None),
+    ("events", "EventSimulation", "_EventSimulation__start_action", "event.start_action", None),
+    ("events", "EventSimulation", "_EventSimulation__finish_segment", "event.finish_segment", None),
+    ("events", "EventSimulation", "_EventSimulation__finish_action", "event.finish_action", None),
+    ("events", "EventSimulation", "_EventSimulation__assign", "event.assign", None),
+    ("events", "EventSimulation", "_EventSimulation__wake_robots", "event.wake_robots", None),
+    ("field", "Field", "update_field", "field.update_field", None),
+    ("field", "Field", "assign_cargo", "field.assign_cargo", None),
+    ("field", "Field", "select_nearest_cargo", "field.select_nearest_cargo", "selections"),
+    ("field", "Field", "shoot_cargo", None, "shots"),
+    ("field", "Field", "miss_cargo", None, "misses"),
+    ("cargo", "CargoSpawner", "spawn", None, "spawns"),
+    ("field", "Field", "draw", "draw.field", None),
+    ("robot", "Robot", "draw", "draw.robot", None),
+    ("game", "ScoreBoard", "draw", "draw.score_board", None),
+    ("graphics", "Renderer", "end_frame", "draw.display_update", None),
+)
+
+
+class Profiler:
+    """
+    Opt-in instrumentation of the simulation loop.
+    While installed, the instrumented functions are replaced by wrappers that time them and count events, and restored
+    when uninstalled, so the simulation pays nothing for profiling when it is not enabled. Phase times are inclusive, e.g.
+    robot.select_cargo includes field.select_nearest_cargo and plan_path.
+    Robots cache their actions when they are built, so the profiler must be installed before the match is built.
+    The tick and event engines are instrumented; the vectorized engine runs none of these functions per robot, so it
+    cannot be profiled.
+    """
+
+    def __init__(self):
+        self.phases: Dict[str, List[float]] = {}
+        self.counters: Dict[str, int] = {}
+        # Called with the phase name and its wall time after every timed call
+        self.hooks: List[Callable[[str, float], None]] = []
+        self.originals = []
+        self.start_time = None
+        self.wall_time = 0.0
+
+    def __enter__(self) -> Profiler:
+        self.install()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.uninstall()
+
+    def add_hook(self, hook: Callable[[str, float], None]):
+        self.hooks.append(hook)
+
+    def install(self):
+        for module_name, class_name, attribute, phase, counter in INSTRUMENTED:
+            # Modules which were never imported (e.g. graphics in headless runs) are not imported just to be profiled
+            module = sys.modules.get(module_name)
+            if module is None:
+                continue
+            owner = getattr(module, class_name) if class_name else module
+            original = owner.__dict__[attribute]
+            self.originals.append((owner, attribute, original))
+            setattr(owner, attribute, self.__wrap(original, phase, counter))
+        self.start_time = time.perf_counter()
+
+    def uninstall(self):
+        for owner, attribute, original in reversed(self.originals):
+            setattr(owner, attribute, original)
+        self.originals = []
+        if self.start_time is not None:
+            self.wall_time += time.perf_counter() - self.start_time
+            self.start_time = None
+
+    def record(self, phase: str, elapsed: float):
+        totals = self.phases.setdefault(phase, [0, 0.0])
+        totals[0] += 1
+        totals[1] += elapsed
+        for hook in self.hooks:
+            hook(phase, elapsed)
+
+    def count(self, counter: str, amount: int = 1):
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def summary(self, sim_time: Optional[float] = None) -> dict:
+        wall_time = self.wall_time
+        if self.start_time is not None:
+            wall_time += time.perf_counter() - self.start_time
+        result = {
+            "wall_time": wall_time,
+            "phases": {phase: {"calls": calls, "total_time": total, "mean_time_us": total / calls * 1e6}
+                       for phase, (calls, total) in sorted(self.phases.items(), key=lambda item: -item[1][1])},
+            "counters": dict(sorted(self.counters.items())),
+        }
+        if sim_time is not None:
+            result["sim_time"] = sim_time
+            result["sim_to_wall_ratio"] = sim_time / wall_time if wall_time else None
+        return result
+
+    def __wrap(self, function: Callable, phase: Optional[str], counter: Optional[str]) -> Callable:
+        perf_counter = time.perf_counter
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if counter:
+                self.count(counter)
+            if not phase:
+                return function(*args, **kwargs)
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(phase, perf_counter() - start)
+        return wrapper
+
+
+def write_profile(profile: dict, path: str):
+    """
+    Write a profile summary as JSON into path, or print it if path is "-".
+    """
+    if path == "-":
+        print(json.dumps(profile, indent=2))
+        return
+    with open(path, "w") as profile_file:
+        json.dump(profile, profile_file, indent=2)
@@ -0,0 +1,191 @@
+from __future__ import annotations
+import json
+from math import ceil
+from typing import Dict, List, Tuple, TYPE_CHECKING
+import numpy as np
+from alliance import Alliance
+if TYPE_CHECKING:
+    from field import Field
+    from robot import Robot
+
+MAGIC = b"RRSIMREC"
+VERSION = 1
+SECTION_ALIGNMENT = 64
+SAMPLE_INTERVAL = 0.1
+KEYFRAME_INTERVAL = 50
+
+ALLIANCE_CODES = {Alliance.RED: 1, Alliance.BLUE: 2}
+ALLIANCES_BY_CODE = {code: alliance for alliance, code in ALLIANCE_CODES.items()}
+ROBOT_DTYPE = np.dtype([("x", "<f2"), ("y", "<f2"), ("action", "u1"), ("num_cargo", "u1")])
+# A cargo slot with alliance 0 is empty
+CARGO_DTYPE = np.dtype([("x", "<f2"), ("y", "<f2"), ("alliance", "u1")])
+EVENT_DTYPE = np.dtype([("frame", "<u4"), ("slot", "<u2"), ("cargo", CARGO_DTYPE)])
+
+
+def frame_dtype(num_robots: int) -> np.dtype:
+    return np.dtype([("time", "<f4"), ("score", "<u2", (2,)), ("hub", "<u2", (2,)),
+                     ("robots", ROBOT_DTYPE, (num_robots,))])
+
+
+def keyframe_dtype(cargo_capacity: int) -> np.dtype:
+    # event is the number of cargo events that happened up to and including the keyframe
+    return np.dtype([("event", "<u4"), ("cargo", CARGO_DTYPE, (cargo_capacity,))])
+
+
+class MatchRecorder:
+    """
+    Records a match into a compact binary file with a fixed layout.
+    Robots, scores and hub contents are sampled at a fixed interval. Floor cargo rarely changes, so it is stored as a
+    log of cargo appearing and disappearing, with the full cargo table stored at periodic keyframes for seeking.
+    The whole recording of a match is kept in memory and written when the recorder is closed.
+    """
+
+    def __init__(self, path: str, field: Field, robots: List[Robot], match_length: float,
+                 sample_interval: float = SAMPLE_INTERVAL, keyframe_interval: int = KEYFRAME_INTERVAL,
+                 dt: float = None):
+        # Every step can capture at most one frame, so longer steps would leave frames further and further behind
+        if dt is not None and dt > sample_interval + 1e-9:
+            raise ValueError(f"Matches can only be recorded with a timestep of at most {sample_interval}s")
+        self.path = path
+        self.robots = robots
+        self.match_length = match_length
+        self.sample_interval = sample_interval
+        self.keyframe_interval = keyframe_interval
+        # Cargo is recycled through the field's pool, so the index of a cargo in the pool is its slot in the recording
+        self.cargo_capacity = field.cargo_pool.capacity
+
+        num_frames = ceil(match_length / sample_interval - 1e-9) + 1
+        self.frames = np.zeros(num_frames, dtype=frame_dtype(len(robots)))
+        self.keyframes = np.zeros(ceil(num_frames / keyframe_interval), dtype=keyframe_dtype(self.cargo_capacity))
+        self.events = []
+        self.num_frames = 0
+
+        self.cargo_table = np.zeros(self.cargo_capacity, dtype=CARGO_DTYPE)
+        # The last recorded cargo of every occupied slot
+        self.recorded_cargo: Dict[int, Tuple[float, float, int]] = {}
+        self.capture(field, 0.0)
+
+    def capture(self, field: Field, time: float):
+        """
+        Record the state of the match at time if a sample is due.
+        """
+        if self.num_frames == len(self.frames) or time < self.num_frames * self.sample_interval - 1e-9:
+            return
+        index = self.num_frames
+        self.__capture_cargo(field, index)
+        frame = self.frames[index]
+        frame["time"] = time
+        frame["score"] = field.score_keeper.score[Alliance.RED], field.score_keeper.score[Alliance.BLUE]
+        frame["hub"] = len(field.hub.cargo_timeouts[Alliance.RED]), len(field.hub.cargo_timeouts[Alliance.BLUE])
+        frame["robots"] = [(robot.position[0], robot.position[1], robot.current_action, robot.num_cargo)
+                           for robot in self.robots]
+        if index % self.keyframe_interval == 0:
+            keyframe = self.keyframes[index // self.keyframe_interval]
+            keyframe["event"] = len(self.events)
+            keyframe["cargo"] = self.cargo_table
+        self.num_frames += 1
+
+    def __capture_cargo(self, field: Field, index: int):
+        # A slot may have been collected and reused since the last sample, so its contents are compared as well
+        floor_cargo = {cargo.index: (cargo.x, cargo.y, ALLIANCE_CODES[cargo.alliance]) for cargo in field.floor_cargo}
+        for slot in [slot for slot in self.recorded_cargo if slot not in floor_cargo]:
+            del self.recorded_cargo[slot]
+            self.__log_event(index, slot, (0.0, 0.0, 0))
+        for slot, cargo in floor_cargo.items():
+            if self.recorded_cargo.get(slot) != cargo:
+                self.recorded_cargo[slot] = cargo
+                self.__log_event(index, slot, cargo)
+
+    def __log_event(self, index: int, slot: int, cargo: Tuple[float, float, int]):
+        self.cargo_table[slot] = cargo
+        self.events.append((index, slot, cargo))
+
+    def close(self):
+        frames = self.frames[:self.num_frames]
+        keyframes = self.keyframes[:ceil(self.num_frames / self.keyframe_interval)]
+        events = np.array(self.events, dtype=EVENT_DTYPE)
+        header = {"version": VERSION, "match_length": self.match_length, "sample_interval": self.sample_interval,
+                  "keyframe_interval": self.keyframe_interval, "cargo_capacity": self.cargo_capacity,
+                  "alliances": [robot.alliance.value for robot in self.robots], "sections": {}}
+
+        # Section offsets depend on the header's length, so it is padded to leave room for them
+        offset = SECTION_ALIGNMENT * ceil((len(MAGIC) + 4 + len(json.dumps(header)) + 256) / SECTION_ALIGNMENT)
+        for name, array in (("frames", frames), ("keyframes", keyframes), ("events", events)):
+            header["sections"][name] = [offset, len(array)]
+            offset += SECTION_ALIGNMENT * ceil(array.nbytes / SECTION_ALIGNMENT)
+
+        encoded_header = json.dumps(header).encode()
+        with open(self.path, "wb") as recording_file:
+            recording_file.write(MAGIC + len(encoded_header).to_bytes(4, "little") + encoded_header)
+            for name, array in (("frames", frames), ("keyframes", keyframes), ("events", events)):
+                recording_file.seek(header["sections"][name][0])
+                recording_file.write(array.tobytes())
+
+
+class MatchRecording:
+    """
+    A recorded match, memory-mapped so that only the parts being replayed are read from the disk.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as recording_file:
+            if recording_file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"'{path}' is not a match recording")
+            header_length = int.from_bytes(recording_file.read(4), "little")
+            header = json.loads(recording_file.read(header_length))
+        if header["version"] != VERSION:
+            raise ValueError(f"Unsupported recording version {header['version']}")
+
+        self.match_length = header["match_length"]
+        self.sample_interval = header["sample_interval"]
+        self.keyframe_interval = header["keyframe_interval"]
+        self.alliances = [Alliance(alliance) for alliance in header["alliances"]]
+        dtypes = {"frames": frame_dtype(len(self.alliances)), "keyframes": keyframe_dtype(header["cargo_capacity"]),
+                  "events": EVENT_DTYPE}
+        sections = {}
+        for name, (offset, count) in header["sections"].items():
+            if count:
+                sections[name] = np.memmap(path, dtype=dtypes[name], mode="r", offset=offset, shape=(count,))
+            else:
+                sections[name] = np.zeros(0, dtype=dtypes[name])
+        self.frames, self.keyframes, self.events = sections["frames"], sections["keyframes"], sections["events"]
+
+    def __len__(self):
+        return len(self.frames)
+
+    def time_at(self, index: int) -> float:
+        return float(self.frames[index]["time"])
+
+    def frame_at(self, time: float) -> int:
+        """
+        The index of the frame captured closest to time, searched on the frames' capture times, as steps that do
+        not divide the sample interval capture frames somewhat after their sample is due.
+        """
+        times = self.frames["time"]
+        index = int(np.searchsorted(times, time))
+        if index == len(times) or (index > 0 and time - times[index - 1] <= times[index] - time):
+            index -= 1
+        return max(index, 0)
+
+    def cargo_at(self, index: int) -> List[Tuple[float, float, Alliance]]:
+        """
+        The floor cargo at the given frame, rebuilt from the last keyframe and the cargo events since.
+        """
+        keyframe = self.keyframes[index // self.keyframe_interval]
+        table = np.array(keyframe["cargo"])
+        last_event = np.searchsorted(self.events["frame"], index, side="right")
+        for event in self.events[keyframe["event"]:last_event]:
+            table[event["slot"]] = event["cargo"]
+        return [(float(cargo["x"]), float(cargo["y"]), ALLIANCES_BY_CODE[int(cargo["alliance"])])
+                for cargo in table if cargo["alliance"]]
+
+    def state_at(self, index: int) -> Dict:
+        frame = self.frames[index]
+        return {
+            "time": float(frame["time"]),
+            "score": {Alliance.RED: int(frame["score"][0]), Alliance.BLUE: int(frame["score"][1])},
+            "hub": {Alliance.RED: int(frame["hub"][0]), Alliance.BLUE: int(frame["hub"][1])},
+            "robots": [((float(robot["x"]), float(robot["y"])), int(robot["action"]), int(robot["num_cargo"]))
+                       for robot in frame["robots"]],
+            "cargo": self.cargo_at(index),
+        }
@@ -0,0 +1,227 @@
+from __future__ import annotations
+import csv
+import os
+from math import floor, sqrt
+from typing import List
+import numpy as np
+from alliance import Alliance
+
+# Bins of a new histogram, which grows to hold higher scores
+HISTOGRAM_BINS = 1024
+# Per-match rows buffered before they are written to the rows file
+ROW_CHUNK_SIZE = 65536
+ROBOT_COUNTS = ("cargo_collected", "shots_made", "shots_missed")
+
+
+class ResultSink:
+    """
+    Aggregates match results as they come in, in memory independent of the number of matches: the running mean and
+    variance of every alliance's score (Welford's algorithm), a histogram of every alliance's scores for percentiles,
+    win and tie counts, and the total counts of every robot.
+    Sinks filled by different workers are combined with merge().
+    """
+
+    def __init__(self, bin_width: int = 1):
+        self.bin_width = bin_width
+        self.count = 0
+        self.mean = np.zeros(2)
+        # Sum of squared differences from the mean
+        self.m2 = np.zeros(2)
+        self.histogram = np.zeros((2, HISTOGRAM_BINS), dtype=np.int64)
+        self.red_wins = 0
+        self.blue_wins = 0
+        self.ties = 0
+        self.robot_alliances: List[str] = []
+        self.robot_counts = np.zeros((0, len(ROBOT_COUNTS)), dtype=np.int64)
+
+    def add_scores(self, scores: np.ndarray):
+        """
+        Add the (RED, BLUE) scores of any number of matches, given as an array of shape (matches, 2).
+        """
+        if not len(scores):
+            return
+        mean = scores.mean(axis=0)
+        self.__combine(len(scores), mean, ((scores - mean) ** 2).sum(axis=0))
+        bins = scores // self.bin_width
+        self.__grow_histogram(int(bins.max()) + 1)
+        for column in range(2):
+            self.histogram[column] += np.bincount(bins[:, column], minlength=self.histogram.shape[1])
+        red_wins = int(np.count_nonzero(scores[:, 0] > scores[:, 1]))
+        blue_wins = int(np.count_nonzero(scores[:, 0] < scores[:, 1]))
+        self.red_wins += red_wins
+        self.blue_wins += blue_wins
+        self.ties += len(scores) - red_wins - blue_wins
+
+    def add_robot_stats(self, robot_stats: List[dict]):
+        """
+        Add the stats of every robot in a match, as returned by Robot.get_stats.
+        """
+        if not self.robot_alliances:
+            self.__set_robots([stats["alliance"] for stats in robot_stats])
+        for i, stats in enumerate(robot_stats):
+            for j, key in enumerate(ROBOT_COUNTS):
+                self.robot_counts[i, j] += stats[key]
+
+    def merge(self, other: ResultSink):
+        """
+        Add the matches aggregated by another sink of the same bin width.
+        """
+        if other.bin_width != self.bin_width:
+            raise ValueError("Only sinks of the same bin width can be merged")
+        if other.robot_alliances:
+            if not self.robot_alliances:
+                self.__set_robots(other.robot_alliances)
+            if other.robot_alliances != self.robot_alliances:
+                raise ValueError("Only sinks of matches with the same robots can be merged")
+            self.robot_counts += other.robot_counts
+        self.__combine(other.count, other.mean, other.m2)
+        self.__grow_histogram(other.histogram.shape[1])
+        self.histogram[:, :other.histogram.shape[1]] += other.histogram
+        self.red_wins += other.red_wins
+        self.blue_wins += other.blue_wins
+        self.ties += other.ties
+
+    def __set_robots(self, alliances: List[str]):
+        self.robot_alliances = list(alliances)
+        self.robot_counts = np.zeros((len(alliances), len(ROBOT_COUNTS)), dtype=np.int64)
+
+    def __grow_histogram(self, num_bins: int):
+        """
+        Widen the histogram to at least num_bins bins, doubling it so that rising scores only grow it a few times.
+        """
+        if num_bins <= self.histogram.shape[1]:
+            return
+        width = self.histogram.shape[1]
+        while width < num_bins:
+            width *= 2
+        self.histogram = np.pad(self.histogram, ((0, 0), (0, width - self.histogram.shape[1])))
+
+    def __combine(self, count: int, mean: np.ndarray, m2: np.ndarray):
+        """
+        Chan et al.'s update of the mean and squared differences with those of another group of matches.
+        """
+        total = self.count + count
+        if not total:
+            return
+        delta = mean - self.mean
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / total
+        self.mean = self.mean + delta * count / total
+        self.count = total
+
+    def percentile(self, column: int, percentile: float) -> float:
+        """
+        A percentile of an alliance's scores, interpolated like numpy.percentile. Exact with a bin width of 1.
+        """
+        cumulative = np.cumsum(self.histogram[column])
+        rank = percentile / 100 * (self.count - 1)
+        low, high = floor(rank), min(floor(rank) + 1, self.count - 1)
+        low_value, high_value = (int(np.searchsorted(cumulative, index, side="right")) * self.bin_width
+                                 for index in (low, high))
+        return low_value + (high_value - low_value) * (rank - low)
+
+    def summary(self) -> dict:
+        """
+        The aggregate statistics: the match count, every alliance's mean, standard deviation, percentiles and win rate,
+        the tie rate, and the per-match means of every robot's counts.
+        """
+        from batch import PERCENTILES
+        summary = {"matches": self.count}
+        if not self.count:
+            return summary
+        wins = {Alliance.RED: self.red_wins, Alliance.BLUE: self.blue_wins}
+        for column, alliance in enumerate((Alliance.RED, Alliance.BLUE)):
+            summary[alliance.value] = {
+                "mean": float(self.mean[column]),
+                "std": sqrt(self.m2[column] / self.count),
+                "percentiles": {str(p): float(self.percentile(column, p)) for p in PERCENTILES},
+                "win_rate": wins[alliance] / self.count,
+            }
+        summary["tie_rate"] = self.ties / self.count
+        if self.robot_alliances:
+            summary["robots"] = [dict({"alliance": alliance},
+                                      **{key: float(total) / self.count for key, total in zip(ROBOT_COUNTS, counts)})
+                                 for alliance, counts in zip(self.robot_alliances, self.robot_counts)]
+        return summary
+
+
+class MatchRowWriter:
+    """
+    Appends one row per match (its index, the RED and BLUE scores and every robot's shots made) to a CSV file, or to a
+    directory of .npy chunks of ROW_CHUNK_SIZE rows if the path does not end with .csv.
+    Rows are buffered and written a chunk at a time, so memory does not grow with the number of matches.
+    Appending to the rows of an earlier run continues its match indices, and requires the same columns.
+    """
+
+    def __init__(self, path: str, num_robots: int):
+        self.path = path
+        self.columns = ["match", Alliance.RED.value, Alliance.BLUE.value] + \
+            [f"robot_{i}_shots_made" for i in range(num_robots)]
+        self.buffer: List[np.ndarray] = []
+        self.buffered = 0
+        self.written = 0
+        self.chunk = 0
+        if self.is_csv:
+            if os.path.exists(path):
+                with open(path, "r", newline="") as rows_file:
+                    reader = csv.reader(rows_file)
+                    if next(reader, []) != self.columns:
+                        raise self.__columns_error()
+                    self.written = sum(1 for row in reader if row)
+            else:
+                with open(path, "w", newline="") as rows_file:
+                    csv.writer(rows_file).writerow(self.columns)
+        else:
+            os.makedirs(path, exist_ok=True)
+            # Continue after the chunks of earlier runs, which are only mapped to read their shape
+            for name in sorted(name for name in os.listdir(path) if name.startswith("chunk_")):
+                rows = np.load(os.path.join(path, name), mmap_mode="r")
+                if rows.ndim != 2 or rows.shape[1] != len(self.columns):
+                    raise self.__columns_error()
+                self.written += len(rows)
+                self.chunk += 1
+
+    def __columns_error(self) -> ValueError:
+        return ValueError(f"Cannot append to the rows in '{self.path}', as they have different columns")
+
+    @property
+    def is_csv(self) -> bool:
+        return self.path.endswith(".csv")
+
+    def __enter__(self) -> MatchRowWriter:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+    def write(self, rows: np.ndarray):
+        """
+        Append rows of shape (matches, columns - 1), the match index column being added here.
+        """
+        indices = np.arange(self.written + self.buffered, self.written + self.buffered + len(rows))
+        self.buffer.append(np.column_stack((indices, rows)))
+        self.buffered += len(rows)
+        if self.buffered >= ROW_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.buffered:
+            return
+        rows = np.concatenate(self.buffer)
+        if self.is_csv:
+            with open(self.path, "a", newline="") as rows_file:
+                csv.writer(rows_file).writerows(rows.tolist())
+        else:
+            np.save(os.path.join(self.path, f"chunk_{self.chunk:06d}.npy"), rows)
+            self.chunk += 1
+        self.written += self.buffered
+        self.buffer, self.buffered = [], 0
+
+
+def load_rows(path: str) -> np.ndarray:
+    """
+    Read back all the rows written by a MatchRowWriter, as an array of shape (matches, columns).
+    """
+    if path.endswith(".csv"):
+        return np.loadtxt(path, delimiter=",", skiprows=1, dtype=np.int64, ndmin=2)
+    chunks = sorted(name for name in os.listdir(path) if name.startswith("chunk_"))
+    return np.concatenate([np.load(os.path.join(path, name)) for name in chunks])
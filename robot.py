@@ -2,8 +2,9 @@ from __future__ import annotations
 from typing import TYPE_CHECKING, Tuple, Callable, List
 from alliance import get_alliance_color
 from cargo import Cargo
-from math import sqrt
-from random import random
+from functools import lru_cache
+from math import sqrt, dist
+import numpy as np
 from field import Hub
 if TYPE_CHECKING:
     from field import Field
@@ -13,16 +14,26 @@ if TYPE_CHECKING:
 
 class Robot:
     ROBOT_LEN = 0.7
+    # Indices of the actions in the robot's cycle
+    SELECT, DRIVE, COLLECT, SHOOT = range(4)
+    # Number of shot outcomes drawn from the robot's generator at once
+    SHOT_BLOCK_SIZE = 64
+    __slots__ = ("x", "y", "collect_time", "shoot_time", "velocity", "accuracy", "alliance", "num_cargo",
+                 "cargo_collected", "shots_made", "shots_missed", "action_time", "current_action", "post_action_time",
+                 "selected_cargo", "path", "cycle", "rng", "shot_draws", "next_shot_draw")
 
     def __init__(self, position: Tuple[float, float], collect_time: float, shoot_time: float, velocity: float,
-                 accuracy: float, alliance: Alliance):
-        self.position = position
+                 accuracy: float, alliance: Alliance, rng: np.random.Generator = None):
+        self.x, self.y = position
         self.collect_time = collect_time
         self.shoot_time = shoot_time
         self.velocity = velocity
         self.accuracy = max(min(accuracy, 1), 0)
         self.alliance = alliance
         self.num_cargo = 0
+        self.cargo_collected = 0
+        self.shots_made = 0
+        self.shots_missed = 0
 
         self.action_time = 0.0
         self.current_action = 0
@@ -30,6 +41,18 @@ class Robot:
         self.selected_cargo = None
         self.path = None
         self.cycle = [self.select_cargo, self.drive, self.collect_ball, self.shoot_ball]
+        # Shot outcomes come from the robot's own stream, so they do not depend on the other robots
+        self.rng = rng if rng else np.random.default_rng()
+        self.shot_draws = []
+        self.next_shot_draw = 0
+
+    @property
+    def position(self) -> Tuple[float, float]:
+        return self.x, self.y
+
+    @position.setter
+    def position(self, position: Tuple[float, float]):
+        self.x, self.y = position
 
     def perform_actions(self, field: Field, dt: float):
         """
@@ -42,49 +65,83 @@ class Robot:
 
     def collect_ball(self, field: Field, dt: float):
         if not self.action_time:
-            self.action_time = self.collect_time
+            self.action_time = self.collect_time * field.congestion.factor(self) if field.congestion else \
+                self.collect_time
         if dt < self.action_time:
             self.action_time -= dt
         elif dt >= self.action_time:
             self.action_time = 0
             dt -= self.action_time
-            self.num_cargo += 1
-            field.collect_cargo(self.selected_cargo)
-            self.__next_action()
+            self.__finish_collect(field)
 
         return dt
 
     def shoot_ball(self, field: Field, dt: float):
         if not self.action_time:
-            self.action_time = self.shoot_time
+            self.action_time = self.shoot_time * field.congestion.factor(self) if field.congestion else self.shoot_time
         if dt < self.action_time:
             self.action_time -= dt
         elif dt >= self.action_time:
             self.action_time = 0
             dt -= self.action_time
-            self.num_cargo -= 1
-            if random() <= self.accuracy:
-                field.shoot_cargo(self.alliance)
-            else:
-                field.miss_cargo(self.alliance)
-            self.__next_action()
+            self.__finish_shoot(field)
 
         return dt
 
     def drive(self, field: Field, dt: float):
-        remaining_dt = self.path.traverse(self.velocity, dt)
-        self.position = self.path.position
+        congestion = field.congestion
+        velocity = self.velocity / congestion.factor(self) if congestion else self.velocity
+        remaining_dt = self.path.traverse(velocity, dt)
+        self.x, self.y = self.path.x, self.path.y
+        if congestion:
+            congestion.move(self)
         if self.path.done:
-            self.__next_action()
-            self.path = None
+            self.__finish_drive()
         return dt - remaining_dt
 
     def select_cargo(self, field: Field, dt: float):
-        self.selected_cargo = field.select_nearest_cargo(self.alliance, self.position)
+        if self.selected_cargo is None:
+            # Cargo may already have been assigned to the robot by the field's assignment policy
+            self.selected_cargo = field.assignment.select(field, self)
+        if not self.selected_cargo:
+            # All of the alliance's cargo is taken (or the robot waits for the next assignment), wait for some to
+            # become available
+            return dt
         self.path = plan_path(self.position, (self.selected_cargo.x, self.selected_cargo.y))
         self.__next_action()
         return 0.0
 
+    def action_duration(self) -> float:
+        """
+        Total time the current action takes, from its beginning.
+        """
+        if self.current_action == self.DRIVE:
+            return self.path.length / self.velocity
+        if self.current_action == self.COLLECT:
+            return self.collect_time
+        if self.current_action == self.SHOOT:
+            return self.shoot_time
+        return 0.0
+
+    def finish_action(self, field: Field):
+        """
+        Complete the current (non-select) action at once, regardless of its remaining time.
+        """
+        self.action_time = 0
+        if self.current_action == self.DRIVE:
+            self.path.position = self.path.points[-1]
+            self.path.done = True
+            self.x, self.y = self.path.x, self.path.y
+            self.__finish_drive()
+        elif self.current_action == self.COLLECT:
+            self.__finish_collect(field)
+        elif self.current_action == self.SHOOT:
+            self.__finish_shoot(field)
+
+    def get_stats(self) -> dict:
+        return {"alliance": self.alliance.value, "cargo_collected": self.cargo_collected,
+                "shots_made": self.shots_made, "shots_missed": self.shots_missed}
+
     def draw(self, graphics: GraphicsArea):
         graphics.draw_rect(get_alliance_color(self.alliance),
                            (self.position[0]-self.ROBOT_LEN/2, self.position[1]-self.ROBOT_LEN/2,
@@ -94,6 +151,36 @@ class Robot:
         #if self.path:
         #    self.path.draw(graphics)
 
+    def __finish_drive(self):
+        self.__next_action()
+        self.path = None
+
+    def __finish_collect(self, field: Field):
+        self.num_cargo += 1
+        self.cargo_collected += 1
+        field.collect_cargo(self.selected_cargo)
+        # The collected cargo went back to the field's pool and may be reused for other cargo
+        self.selected_cargo = None
+        self.__next_action()
+
+    def __finish_shoot(self, field: Field):
+        self.num_cargo -= 1
+        if self.__draw_shot() <= self.accuracy:
+            self.shots_made += 1
+            field.shoot_cargo(self.alliance)
+        else:
+            self.shots_missed += 1
+            field.miss_cargo(self.alliance)
+        self.__next_action()
+
+    def __draw_shot(self) -> float:
+        if self.next_shot_draw == len(self.shot_draws):
+            self.shot_draws = self.rng.random(self.SHOT_BLOCK_SIZE).tolist()
+            self.next_shot_draw = 0
+        draw = self.shot_draws[self.next_shot_draw]
+        self.next_shot_draw += 1
+        return draw
+
     def __get_current_action(self) -> Callable:
         return self.cycle[self.current_action]
 
@@ -102,44 +189,51 @@ class Robot:
         self.current_action %= len(self.cycle)
 
 
-class Line:
-    def __init__(self, a: Tuple[float, float], b: Tuple[float, float]):
-        self.a = a
-        self.b = b
-        self.m = (a[1] - b[1]) / (a[0] - b[0])
-
-    def get_point_y(self, x: float):
-        return self.m * (x - self.a[0]) + self.a[1]
-
-    def get_point_x(self, y: float):
-        return (y - self.a[1] + self.m * self.a[0]) / self.m
-
-    def get_disection(self, other: Line):
-        x = (self.m * self.a[0] - self.a[1] - other.m * other.a[0] + other.a[1]) / (self.m - other.m)
-        return x, self.get_point_y(x)
-
-
 class Path:
+    __slots__ = ("points", "x", "y", "next_point_idx", "done")
+
     def __init__(self, points: List[Tuple[float, float]]):
         self.points = points
-        self.position = points[0]
+        # The position is kept as two floats, so moving along the path allocates nothing
+        self.x, self.y = points[0]
         self.next_point_idx = 1
         self.done = False
 
+    @property
+    def position(self) -> Tuple[float, float]:
+        return self.x, self.y
+
+    @position.setter
+    def position(self, position: Tuple[float, float]):
+        self.x, self.y = position
+
+    @property
+    def length(self) -> float:
+        return sum(sqrt((b[0] - a[0]) ** 2 + (b[1] - a[1]) ** 2) for a, b in zip(self.points, self.points[1:]))
+
+    def distance_to_next_point(self) -> float:
+        next_point = self.points[self.next_point_idx]
+        return sqrt((next_point[0] - self.x) ** 2 + (next_point[1] - self.y) ** 2)
+
+    def skip_to_next_point(self):
+        self.x, self.y = self.points[self.next_point_idx]
+        self.next_point_idx += 1
+        self.done = self.next_point_idx == len(self.points)
+
     def traverse(self, velocity: float, dt: float) -> float:
         while dt > 0:
             next_point = self.points[self.next_point_idx]
-            dx = next_point[0] - self.position[0]
-            dy = next_point[1] - self.position[1]
+            dx = next_point[0] - self.x
+            dy = next_point[1] - self.y
             target_distance = sqrt(dx * dx + dy * dy)
             possible_distance = velocity * dt
             if possible_distance < target_distance:
                 # We cannot arrive at target
                 distance_proportion = possible_distance / target_distance
-                self.position = (self.position[0] + dx * distance_proportion,
-                                 self.position[1] + dy * distance_proportion)
+                self.x += dx * distance_proportion
+                self.y += dy * distance_proportion
                 return 0.0
-            self.position = next_point
+            self.x, self.y = next_point
             self.next_point_idx += 1
             dt -= target_distance / velocity
             if self.next_point_idx == len(self.points):
@@ -153,74 +247,249 @@ class Path:
             graphics.draw_line("green", self.points[i], self.points[i+1], 5)
 
 
-def get_collisions_with_rect(line: Line, top_left: Tuple[float, float], bottom_right: Tuple[float, float]):
-    if (line.a[0] < top_left[0] and line.b[0] < top_left[0]) or \
-            (line.a[0] > bottom_right[0] and line.b[0] > bottom_right[0]):
-        return None, None, None, None
-    if (line.a[1] < bottom_right[1] and line.b[1] < bottom_right[1]) or \
-            (line.a[1] > top_left[1] and line.b[1] > top_left[1]):
-        return None, None, None, None
-
-    left = line.get_point_y(top_left[0])
-    right = line.get_point_y(bottom_right[0])
-    top = line.get_point_x(top_left[1])
-    bottom = line.get_point_x(bottom_right[1])
-
-    if not (bottom_right[1] < left < top_left[1]):
-        left = None
-    if not (bottom_right[1] < right < top_left[1]):
-        right = None
-    if not (top_left[0] < top < bottom_right[0]):
-        top = None
-    if not (top_left[0] < bottom < bottom_right[0]):
-        bottom = None
-
-    return left, right, top, bottom
-
-
-def get_traversal_points(line: Line, top_left: Tuple[float, float], bottom_right: Tuple[float, float]):
-    left, right, top, bottom = get_collisions_with_rect(line, top_left, bottom_right)
-    if not left and not right and not top and not bottom:
+# The hub grown by half a robot on every side is the only obstacle robots drive around. Field coordinates grow upwards,
+# so HUB_TOP_LEFT is in fact the hub's bottom left corner.
+OBSTACLE_LEFT = Hub.HUB_TOP_LEFT[0] - Robot.ROBOT_LEN / 2
+OBSTACLE_RIGHT = Hub.HUB_TOP_LEFT[0] + Hub.HUB_DIMENSION + Robot.ROBOT_LEN / 2
+OBSTACLE_BOTTOM = Hub.HUB_TOP_LEFT[1] - Robot.ROBOT_LEN / 2
+OBSTACLE_TOP = Hub.HUB_TOP_LEFT[1] + Hub.HUB_DIMENSION + Robot.ROBOT_LEN / 2
+# Corners in counter-clockwise order, so corners i and i + 1 are adjacent
+OBSTACLE_CORNERS = ((OBSTACLE_LEFT, OBSTACLE_BOTTOM), (OBSTACLE_RIGHT, OBSTACLE_BOTTOM),
+                    (OBSTACLE_RIGHT, OBSTACLE_TOP), (OBSTACLE_LEFT, OBSTACLE_TOP))
+PATH_CACHE_SIZE = 4096
+PATH_CACHE_QUANTUM = 0.1
+
+
+def _build_corner_graph():
+    """
+    Shortest routes between every two corners of the obstacle. Adjacent corners see each other along a side of the
+    obstacle, and opposite corners are connected through the one of their common neighbours with the shorter route.
+    """
+    def distance(i, j):
+        return dist(OBSTACLE_CORNERS[i], OBSTACLE_CORNERS[j])
+
+    routes = {}
+    for i in range(4):
+        routes[i, i] = (0.0, (i,))
+        for j in (i - 1) % 4, (i + 1) % 4:
+            routes[i, j] = (distance(i, j), (i, j))
+        opposite = (i + 2) % 4
+        via = min((i - 1) % 4, (i + 1) % 4, key=lambda k: distance(i, k) + distance(k, opposite))
+        routes[i, opposite] = (distance(i, via) + distance(via, opposite), (i, via, opposite))
+    return routes
+
+
+CORNER_ROUTES = _build_corner_graph()
+
+
+def is_inside_obstacle(point: Tuple[float, float]) -> bool:
+    return OBSTACLE_LEFT < point[0] < OBSTACLE_RIGHT and OBSTACLE_BOTTOM < point[1] < OBSTACLE_TOP
+
+
+def is_blocked(a: Tuple[float, float], b: Tuple[float, float]) -> bool:
+    """
+    Whether the segment between a and b passes through the interior of the obstacle. Segments touching its boundary,
+    such as ones running along a side, are not blocked.
+    """
+    if max(a[0], b[0]) <= OBSTACLE_LEFT or min(a[0], b[0]) >= OBSTACLE_RIGHT or \
+            max(a[1], b[1]) <= OBSTACLE_BOTTOM or min(a[1], b[1]) >= OBSTACLE_TOP:
+        return False
+    # Liang-Barsky clipping of the segment to the obstacle
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    t_enter, t_exit = 0.0, 1.0
+    for p, q in ((-dx, a[0] - OBSTACLE_LEFT), (dx, OBSTACLE_RIGHT - a[0]),
+                 (-dy, a[1] - OBSTACLE_BOTTOM), (dy, OBSTACLE_TOP - a[1])):
+        if p == 0:
+            if q < 0:
+                return False
+        elif p < 0:
+            t_enter = max(t_enter, q / p)
+        else:
+            t_exit = min(t_exit, q / p)
+    if t_enter >= t_exit:
+        return False
+    t = (t_enter + t_exit) / 2
+    x, y = a[0] + t * dx, a[1] + t * dy
+    epsilon = 1e-9
+    return OBSTACLE_LEFT + epsilon < x < OBSTACLE_RIGHT - epsilon and OBSTACLE_BOTTOM + epsilon < y < OBSTACLE_TOP - epsilon
+
+
+def _find_route(a: Tuple[float, float], b: Tuple[float, float]) -> Tuple[Tuple[float, float], ...]:
+    if is_inside_obstacle(a) or is_inside_obstacle(b) or not is_blocked(a, b):
         return ()
-    # First handle adjacent sides
-    if left and top:
-        return top_left,
-    if top and right:
-        return (bottom_right[0], top_left[1]),
-    if right and bottom:
-        return bottom_right,
-    if bottom and left:
-        return (top_left[0], bottom_right[1]),
-
-    # Now we handle opposite sides
-    if left and right:
-        avg = (left + right) / 2
-        if (avg - bottom_right[1]) / (top_left[1] - bottom_right[1]) > 0.5:
-            return top_left, (bottom_right[0], top_left[1])
-        return (top_left[0], bottom_right[1]), bottom_right
-    if top and bottom:
-        avg = (top + bottom) / 2
-        if (avg - top_left[0]) / (bottom_right[0] - top_left[0]) > 0.5:
-            return (bottom_right[0], top_left[1]), bottom_right
-        return top_left, (top_left[0], bottom_right[1])
-
-    print("SHOULD NOT HAPPEN")
-
-
-def plan_path(a: Tuple[float, float], b: Tuple[float, float]):
-    path_points = [a]
-
-    buffer = Robot.ROBOT_LEN / 2
-    hub_top_left = (Hub.HUB_TOP_LEFT[0], Hub.HUB_TOP_LEFT[1] + Hub.HUB_DIMENSION) # This is idiotic and needs to be fixed
-    obstacle_top_left = (hub_top_left[0] - buffer, hub_top_left[1] + buffer)
-    obstacle_bottom_right = (hub_top_left[0] + Hub.HUB_DIMENSION + buffer,
-                             hub_top_left[1] - Hub.HUB_DIMENSION - buffer)
-    points = get_traversal_points(Line(a, b), obstacle_top_left, obstacle_bottom_right)
-    if len(points) > 1:
-        path_points.append(Line(a, points[0]).get_disection(Line(points[1], b)))
-    else:
-        path_points += points
-    path_points.append(b)
-    return Path(path_points)
-
-
+    best_length, best_route = float("inf"), ()
+    for i, first in enumerate(OBSTACLE_CORNERS):
+        if is_blocked(a, first):
+            continue
+        for j, last in enumerate(OBSTACLE_CORNERS):
+            if is_blocked(last, b):
+                continue
+            corners_length, corners = CORNER_ROUTES[i, j]
+            length = dist(a, first) + corners_length + dist(last, b)
+            if length < best_length:
+                best_length, best_route = length, tuple(OBSTACLE_CORNERS[k] for k in corners)
+    return best_route
+
+
+def is_near_obstacle(point: Tuple[float, float]) -> bool:
+    """
+    Whether the point is inside the obstacle or close enough to it for its quantized cache key to be on the other side
+    of a side of the obstacle.
+    """
+    margin = PATH_CACHE_QUANTUM
+    return OBSTACLE_LEFT - margin < point[0] < OBSTACLE_RIGHT + margin and \
+        OBSTACLE_BOTTOM - margin < point[1] < OBSTACLE_TOP + margin
+
+
+def _route_length(a: Tuple[float, float], b: Tuple[float, float], route: Tuple[Tuple[float, float], ...]) -> float:
+    distance, previous = 0.0, a
+    for point in route:
+        distance += dist(previous, point)
+        previous = point
+    return distance + dist(previous, b)
+
+
+@lru_cache(maxsize=PATH_CACHE_SIZE)
+def _cached_routes(a: Tuple[int, int], b: Tuple[int, int]) -> Tuple[Tuple[Tuple[float, float], ...], ...]:
+    """
+    The corner routes that may be the shortest one between any end points quantized to a and b: the shortest route
+    between a and b themselves first, followed by every route at most twice the largest quantization error longer.
+    """
+    a = (a[0] * PATH_CACHE_QUANTUM, a[1] * PATH_CACHE_QUANTUM)
+    b = (b[0] * PATH_CACHE_QUANTUM, b[1] * PATH_CACHE_QUANTUM)
+    best = _find_route(a, b)
+    if not best:
+        return ()
+    # Moving both end points by up to half a quantum in each axis changes the length of any route by at most this
+    slack = 2 * sqrt(2) * PATH_CACHE_QUANTUM
+    limit = _route_length(a, b, best) + slack
+    candidates = {tuple(OBSTACLE_CORNERS[k] for k in corners) for _, corners in CORNER_ROUTES.values()}
+    candidates.discard(best)
+    return (best,) + tuple(sorted((route for route in candidates if _route_length(a, b, route) <= limit),
+                                  key=lambda route: _route_length(a, b, route)))
+
+
+def _is_route_clear(a: Tuple[float, float], b: Tuple[float, float], route: Tuple[Tuple[float, float], ...]) -> bool:
+    # Corner routes run along the sides of the obstacle, so only the segments to and from the end points can be blocked
+    return not is_blocked(a, route[0]) and not is_blocked(route[-1], b)
+
+
+def get_route(a: Tuple[float, float], b: Tuple[float, float]) -> Tuple[Tuple[float, float], ...]:
+    """
+    The obstacle corners the shortest path from a to b goes through.
+    The candidate corner routes are cached by quantized end points and checked against the real ones. If the route
+    found for the quantized end points is blocked for the real ones, or an end point is close enough to the obstacle
+    for its quantized key to fall inside it, the route is found without the cache.
+    """
+    if is_near_obstacle(a) or is_near_obstacle(b):
+        return _find_route(a, b)
+    if not is_blocked(a, b):
+        return ()
+    candidates = _cached_routes((round(a[0] / PATH_CACHE_QUANTUM), round(a[1] / PATH_CACHE_QUANTUM)),
+                                (round(b[0] / PATH_CACHE_QUANTUM), round(b[1] / PATH_CACHE_QUANTUM)))
+    if not candidates or not _is_route_clear(a, b, candidates[0]):
+        return _find_route(a, b)
+    return min((route for route in candidates if _is_route_clear(a, b, route)),
+               key=lambda route: _route_length(a, b, route))
+
+
+def plan_path(a: Tuple[float, float], b: Tuple[float, float]) -> Path:
+    return Path([a, *get_route(a, b), b])
+
+
+def travel_distance(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    """
+    Length of the path from a to b, without building the path itself.
+    """
+    return _route_length(a, b, get_route(a, b))
+
+
+def cargo_travel_distance(position: Tuple[float, float], cargo: Cargo) -> float:
+    """
+    The metric robots select cargo by. Robots drive at a constant velocity, so the shortest drive is also the soonest
+    arrival.
+    """
+    return travel_distance(position, (cargo.x, cargo.y))
+
+
+# CORNER_ROUTES lengths as a matrix, and the corners as coordinate arrays, for the array versions below
+CORNER_ROUTE_LENGTHS = np.array([[CORNER_ROUTES[i, j][0] for j in range(4)] for i in range(4)])
+CORNERS_X, CORNERS_Y = np.array(OBSTACLE_CORNERS).T
+
+
+def are_inside_obstacle(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    return (OBSTACLE_LEFT < x) & (x < OBSTACLE_RIGHT) & (OBSTACLE_BOTTOM < y) & (y < OBSTACLE_TOP)
+
+
+def are_blocked(ax: np.ndarray, ay: np.ndarray, bx: np.ndarray, by: np.ndarray) -> np.ndarray:
+    """
+    is_blocked for the segments between arrays of end points, broadcast together.
+    """
+    ax, ay, bx, by = np.broadcast_arrays(ax, ay, bx, by)
+    clear = (np.maximum(ax, bx) <= OBSTACLE_LEFT) | (np.minimum(ax, bx) >= OBSTACLE_RIGHT) | \
+        (np.maximum(ay, by) <= OBSTACLE_BOTTOM) | (np.minimum(ay, by) >= OBSTACLE_TOP)
+    dx, dy = bx - ax, by - ay
+    t_enter, t_exit = np.zeros(dx.shape), np.ones(dx.shape)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for p, q in ((-dx, ax - OBSTACLE_LEFT), (dx, OBSTACLE_RIGHT - ax),
+                     (-dy, ay - OBSTACLE_BOTTOM), (dy, OBSTACLE_TOP - ay)):
+            clear |= (p == 0) & (q < 0)
+            t_enter = np.where(p < 0, np.maximum(t_enter, q / p), t_enter)
+            t_exit = np.where(p > 0, np.minimum(t_exit, q / p), t_exit)
+    t = (t_enter + t_exit) / 2
+    x, y = ax + t * dx, ay + t * dy
+    epsilon = 1e-9
+    return ~clear & (t_enter < t_exit) & (OBSTACLE_LEFT + epsilon < x) & (x < OBSTACLE_RIGHT - epsilon) & \
+        (OBSTACLE_BOTTOM + epsilon < y) & (y < OBSTACLE_TOP - epsilon)
+
+
+def travel_distances(ax: np.ndarray, ay: np.ndarray, bx: np.ndarray, by: np.ndarray) -> np.ndarray:
+    """
+    travel_distance between arrays of end points, broadcast together. Blocked pairs take the shortest of the routes
+    through every visible first and last corner, like _find_route.
+    """
+    ax, ay, bx, by = (np.asarray(v, dtype=float) for v in np.broadcast_arrays(ax, ay, bx, by))
+    distances = np.hypot(bx - ax, by - ay)
+    detour = are_blocked(ax, ay, bx, by) & ~are_inside_obstacle(ax, ay) & ~are_inside_obstacle(bx, by)
+    if not detour.any():
+        return distances
+    ax, ay, bx, by = (v[detour][:, None] for v in (ax, ay, bx, by))
+    to_first = np.where(are_blocked(ax, ay, CORNERS_X, CORNERS_Y), np.inf, np.hypot(CORNERS_X - ax, CORNERS_Y - ay))
+    from_last = np.where(are_blocked(CORNERS_X, CORNERS_Y, bx, by), np.inf, np.hypot(bx - CORNERS_X, by - CORNERS_Y))
+    routes = (to_first[:, :, None] + CORNER_ROUTE_LENGTHS + from_last[:, None, :]).min(axis=(1, 2))
+    # Without any clear route the path is the direct one, like an empty route from _find_route
+    distances[detour] = np.where(np.isfinite(routes), routes, distances[detour])
+    return distances
+
+
+if __name__ == '__main__':
+    # Fuzz end points around the edges of the obstacle: cached routes must never be blocked and must be as short as
+    # the ones found without the cache
+    rng = np.random.default_rng(0)
+    edges = np.array([OBSTACLE_LEFT, OBSTACLE_RIGHT, OBSTACLE_BOTTOM, OBSTACLE_TOP])
+    for _ in range(100000):
+        a, b = ((float(rng.uniform(edges[0] - 1, edges[1] + 1)), float(rng.uniform(edges[2] - 1, edges[3] + 1)))
+                for _ in range(2))
+        if rng.random() < 0.5:
+            # Snap a coordinate to just next to a side, where quantized end points may fall inside the obstacle
+            axis = int(rng.integers(2))
+            a = tuple(float(edges[2 * axis + int(rng.integers(2))] + rng.uniform(-0.1, 0.1)) if i == axis else v
+                      for i, v in enumerate(a))
+        if is_inside_obstacle(a) or is_inside_obstacle(b):
+            continue
+        route = get_route(a, b)
+        points = [a, *route, b]
+        assert not any(is_blocked(p, q) for p, q in zip(points, points[1:])), (a, b, route)
+        assert abs(_route_length(a, b, route) - _route_length(a, b, _find_route(a, b))) < 1e-9, (a, b, route)
+    print("get_route matches _find_route around the obstacle")
+
+    # The array versions must agree with the scalar ones, including end points on and inside the obstacle
+    points = rng.uniform([edges[0] - 1, edges[2] - 1], [edges[1] + 1, edges[3] + 1], size=(20000, 2))
+    points[::4] = np.array(OBSTACLE_CORNERS)[rng.integers(4, size=len(points[::4]))]
+    a, b = points[:10000], points[10000:]
+    blocked = are_blocked(a[:, 0], a[:, 1], b[:, 0], b[:, 1])
+    distances = travel_distances(a[:, 0], a[:, 1], b[:, 0], b[:, 1])
+    for i, (p, q) in enumerate(zip(map(tuple, a), map(tuple, b))):
+        assert blocked[i] == is_blocked(p, q), (p, q)
+        assert abs(distances[i] - _route_length(p, q, _find_route(p, q))) < 1e-9, (p, q, distances[i])
+    print("travel_distances matches travel_distance")
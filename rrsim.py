@@ -1,56 +1,355 @@
-from argparse import ArgumentParser
-import pygame
-import time
-from pygame.locals import *
-from graphics import GraphicsArea
-from cargo import FIELD_WIDTH, FIELD_HEIGHT
-from config import parse_config
+from argparse import ArgumentParser, ArgumentTypeError
+import json
 import sys
 
-SCREEN_WIDTH = 1280
-SCREEN_HEIGHT = 720
+FRAME_RATE = 60
+TIME_SCALES = ("1", "4", "16", "max")
+DEFAULT_CONFIG = "default_configs/config.json"
+# Estimates timed by the estimate command, to report the time of a single one
+ESTIMATE_REPEATS = 100
+COMMANDS = ("run", "batch", "replay", "sweep", "scenarios", "fork", "bench", "estimate")
 
 
-def parse_args():
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def parse_args(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # Running without a command (e.g. "rrsim.py config.json") keeps opening the simulation window
+    if not argv or argv[0] not in COMMANDS + ("-h", "--help"):
+        argv = ["run"] + argv
+    # Modules are imported where they are used rather than at the top, as spawned workers import this module again
+    # and most commands only need a few of them. Only the arguments of the command being run are set up, so only the
+    # modules holding its defaults are imported, e.g. the telemetry server's asyncio only for the run command.
+    command = argv[0]
+
     parser = ArgumentParser("RRSIM - FRC 2022 Rapid React Simulator")
-    parser.add_argument("config_file", nargs="?", default="default_configs/config.json",
-                        help="Path to the JSON configuration file.")
-    return parser.parse_args()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run a single match in the simulation window.")
+    if command == "run":
+        from simulation import DEFAULT_DT
+        from telemetry import DEFAULT_PORT, DEFAULT_RATE
+        run_parser.add_argument("config_file", nargs="?", default=DEFAULT_CONFIG,
+                                help="Path to the JSON configuration file.")
+        run_parser.add_argument("-t", "--time-scale", choices=TIME_SCALES, default="1",
+                                help="Initial simulation speed relative to real time.")
+        run_parser.add_argument("--fps", type=int, default=FRAME_RATE, help="Maximal rendered frames per second.")
+        run_parser.add_argument("--dt", type=float, default=DEFAULT_DT, help="Simulation timestep in seconds.")
+        run_parser.add_argument("-s", "--seed", type=int, default=None, help="Seed of the match (default: random).")
+        run_parser.add_argument("--record", help="Path of a file to record the match into.")
+        run_parser.add_argument("--profile", nargs="?", const="-",
+                                help="Profile the simulation loop and write a JSON summary to the given path (or "
+                                     "print it).")
+        run_parser.add_argument("--telemetry", nargs="?", type=int, const=DEFAULT_PORT,
+                                help=f"Publish the match state as JSON lines on the given localhost port "
+                                     f"({DEFAULT_PORT} if not given).")
+        run_parser.add_argument("--telemetry-rate", type=float, default=DEFAULT_RATE,
+                                help="Telemetry snapshots per second.")
+
+    batch_parser = subparsers.add_parser("batch", help="Run many headless matches and report score statistics.")
+    if command == "batch":
+        from simulation import DEFAULT_DT
+        from batch import BATCH_ENGINES
+        batch_parser.add_argument("config_file", nargs="?", default=DEFAULT_CONFIG,
+                                  help="Path to the JSON configuration file.")
+        batch_parser.add_argument("-n", "--matches", type=positive_int, default=1000, help="Number of matches to run.")
+        batch_parser.add_argument("-s", "--seed", type=int, default=0, help="Master seed of the batch.")
+        batch_parser.add_argument("-w", "--workers", type=int, default=None,
+                                  help="Number of worker processes (default: number of CPUs).")
+        batch_parser.add_argument("--dt", type=float, default=DEFAULT_DT, help="Simulation timestep in seconds.")
+        batch_parser.add_argument("--engine", choices=BATCH_ENGINES, default="tick",
+                                  help="Simulation engine: fixed timestep ticks, discrete events or vectorized "
+                                       "lockstep.")
+        batch_parser.add_argument("--record-dir", help="Directory to record every match into (tick engine only).")
+        batch_parser.add_argument("--rows", help="CSV file (*.csv) or directory of .npy chunks to append every match's "
+                                                 "scores and robot shots into.")
+        batch_parser.add_argument("--profile", nargs="?", const="-",
+                                  help="Profile the matches in a single process and write a JSON summary to the given "
+                                       "path (or print it).")
+        batch_parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+
+    sweep_parser = subparsers.add_parser("sweep", help="Evaluate a grid of robot or field parameters.")
+    if command == "sweep":
+        from simulation import DEFAULT_DT
+        from batch import BATCH_ENGINES
+        from sweep import CACHE_DIR
+        sweep_parser.add_argument("config_file", nargs="?", default=DEFAULT_CONFIG,
+                                  help="Path to the JSON configuration file.")
+        sweep_parser.add_argument("-p", "--param", action="append", required=True, dest="params",
+                                  help="Swept parameter, e.g. robots.0.collect_time=2:6:5 or "
+                                       "robots.*.accuracy=0.7,0.9.")
+        sweep_parser.add_argument("-n", "--matches", type=positive_int, default=200,
+                                  help="Number of matches per grid point.")
+        sweep_parser.add_argument("-s", "--seed", type=int, default=0, help="Master seed shared by all grid points.")
+        sweep_parser.add_argument("-w", "--workers", type=int, default=None,
+                                  help="Number of worker processes (default: number of CPUs).")
+        sweep_parser.add_argument("--dt", type=float, default=DEFAULT_DT, help="Simulation timestep in seconds.")
+        sweep_parser.add_argument("--engine", choices=BATCH_ENGINES, default="tick", help="Simulation engine.")
+        sweep_parser.add_argument("--cache-dir", default=CACHE_DIR, help="Directory of cached grid point results.")
+        sweep_parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+
+    scenarios_parser = subparsers.add_parser("scenarios", help="Run a batch of matches for every scenario of a "
+                                                               "JSON-Lines scenario file.")
+    if command == "scenarios":
+        from simulation import DEFAULT_DT
+        from batch import BATCH_ENGINES
+        scenarios_parser.add_argument("scenario_file", help="Path to the JSON-Lines scenario file.")
+        scenarios_parser.add_argument("-n", "--matches", type=positive_int, default=200,
+                                      help="Number of matches per scenario.")
+        scenarios_parser.add_argument("-s", "--seed", type=int, default=0, help="Master seed shared by all scenarios.")
+        scenarios_parser.add_argument("-w", "--workers", type=int, default=None,
+                                      help="Number of worker processes (default: number of CPUs).")
+        scenarios_parser.add_argument("--dt", type=float, default=DEFAULT_DT, help="Simulation timestep in seconds.")
+        scenarios_parser.add_argument("--engine", choices=BATCH_ENGINES, default="tick", help="Simulation engine.")
+        scenarios_parser.add_argument("--json", action="store_true",
+                                      help="Print every scenario's result as a JSON line.")
+
+    fork_parser = subparsers.add_parser("fork", help="Snapshot a match midway and run many continuations of it.")
+    if command == "fork":
+        from simulation import DEFAULT_DT
+        fork_parser.add_argument("config_file", nargs="?", default=DEFAULT_CONFIG,
+                                 help="Path to the JSON configuration file.")
+        fork_parser.add_argument("--at", type=float, help="Match time in seconds to snapshot the match at.")
+        fork_parser.add_argument("--snapshot", help="Fork a saved snapshot instead of simulating one.")
+        fork_parser.add_argument("--save", help="Path to save the snapshot into.")
+        fork_parser.add_argument("-s", "--seed", type=int, default=0, help="Seed of the match until the snapshot.")
+        fork_parser.add_argument("-n", "--branches", type=positive_int, default=1000,
+                                 help="Number of continuations to run.")
+        fork_parser.add_argument("--branch-seed", type=int, default=0, help="Master seed of the continuations.")
+        fork_parser.add_argument("-w", "--workers", type=int, default=None,
+                                 help="Number of worker processes (default: number of CPUs).")
+        fork_parser.add_argument("--dt", type=float, default=DEFAULT_DT, help="Simulation timestep in seconds.")
+        fork_parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+
+    bench_parser = subparsers.add_parser("bench", help="Benchmark the headless simulation on synthetic scenarios.")
+    if command == "bench":
+        from simulation import DEFAULT_DT
+        from benchmark import DEFAULT_TOLERANCE
+        bench_parser.add_argument("-o", "--output", help="Path of a JSON file to write the results into.")
+        bench_parser.add_argument("-b", "--baseline", help="Path of earlier results to compare against.")
+        bench_parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                                  help="Relative slowdown or growth of a metric reported as a regression.")
+        bench_parser.add_argument("--scenario", action="append", dest="scenarios",
+                                  help="Run only the named scenario (may be repeated).")
+        bench_parser.add_argument("-r", "--repeats", type=int, default=3, help="Timed runs of every scenario.")
+        bench_parser.add_argument("--dt", type=float, default=DEFAULT_DT, help="Simulation timestep in seconds.")
+        bench_parser.add_argument("--quick", action="store_true", help="Cut every match short, for a fast smoke test.")
+        bench_parser.add_argument("--startup", action="store_true",
+                                  help="Only check that the headless modules import quickly and without pygame.")
+        bench_parser.add_argument("--equivalence", action="store_true",
+                                  help="Only check that the vectorized engine reproduces the tick engine's scores.")
+
+    estimate_parser = subparsers.add_parser("estimate", help="Estimate score statistics analytically, without "
+                                                             "simulating matches.")
+    if command == "estimate":
+        from sweep import CACHE_DIR
+        from estimator import CALIBRATION_CONFIGS, CALIBRATION_MATCHES
+        estimate_parser.add_argument("config_file", nargs="?", default=DEFAULT_CONFIG,
+                                     help="Path to the JSON configuration file.")
+        estimate_parser.add_argument("--calibrate", action="store_true",
+                                     help="Fit and cache the estimator's correction factors for the field first.")
+        estimate_parser.add_argument("--configs", type=positive_int, default=CALIBRATION_CONFIGS,
+                                     help="Robot configurations simulated for the calibration.")
+        estimate_parser.add_argument("-n", "--matches", type=positive_int, default=CALIBRATION_MATCHES,
+                                     help="Matches simulated per calibration configuration.")
+        estimate_parser.add_argument("--check", type=positive_int, metavar="MATCHES",
+                                     help="Simulate this many matches and report the estimate's error against them.")
+        estimate_parser.add_argument("-s", "--seed", type=int, default=0, help="Master seed of the simulated matches.")
+        estimate_parser.add_argument("-w", "--workers", type=int, default=None,
+                                     help="Number of worker processes (default: number of CPUs).")
+        estimate_parser.add_argument("--cache-dir", default=CACHE_DIR, help="Directory of cached calibrations.")
+        estimate_parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+
+    replay_parser = subparsers.add_parser("replay", help="Replay a recorded match.")
+    if command == "replay":
+        replay_parser.add_argument("recording", help="Path to the match recording.")
+        replay_parser.add_argument("-t", "--time-scale", choices=TIME_SCALES, default="1",
+                                   help="Initial replay speed relative to real time.")
+        replay_parser.add_argument("--fps", type=int, default=FRAME_RATE, help="Maximal rendered frames per second.")
+
+    return parser.parse_args(argv)
+
+
+def batch(args):
+    from config import load_config, normalize_config
+    from profiling import Profiler, write_profile
+    from batch import aggregate_batch, format_summary
+    if args.profile and args.engine == "vector":
+        sys.exit("Profiling is only supported by the tick and event engines")
+    profiler = Profiler() if args.profile else None
+    if profiler:
+        # Profiling only sees the current process
+        args.workers = 1
+        profiler.install()
+    sink = aggregate_batch(args.config_file, args.matches, args.seed, args.workers, args.dt, args.engine,
+                           args.record_dir, rows_path=args.rows)
+    if profiler:
+        profiler.uninstall()
+    summary = sink.summary()
+    print(json.dumps(summary, indent=2) if args.json else format_summary(summary))
+    if profiler:
+        match_length = normalize_config(load_config(args.config_file))["field"]["match_length"]
+        write_profile(profiler.summary(args.matches * match_length), args.profile)
+
+
+def sweep(args):
+    from sweep import run_sweep, parse_parameter, format_sweep
+    parameters = [parse_parameter(spec) for spec in args.params]
+    results = run_sweep(args.config_file, parameters, args.matches, args.seed, args.workers, args.dt, args.engine,
+                        args.cache_dir)
+    print(json.dumps(results, indent=2) if args.json else format_sweep(results))
+
+
+def scenarios(args):
+    from concurrent.futures import ProcessPoolExecutor
+    from batch import aggregate_batch
+    from scenarios import load_scenarios
+    if not args.json:
+        print(f"{'scenario':>24} {'RED mean':>9} {'BLUE mean':>9} {'RED win':>8} {'BLUE win':>8}")
+    # Scenarios are read and simulated one at a time, so the file may be arbitrarily long
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for scenario in load_scenarios(args.scenario_file):
+            summary = aggregate_batch(scenario, args.matches, args.seed, args.workers, args.dt, args.engine,
+                                      executor=executor).summary()
+            if args.json:
+                print(json.dumps({"name": scenario.name, "key": scenario.key, "summary": summary}), flush=True)
+            else:
+                print(f"{scenario.name:>24} {summary['RED']['mean']:>9.2f} {summary['BLUE']['mean']:>9.2f} "
+                      f"{summary['RED']['win_rate']:>8.3f} {summary['BLUE']['win_rate']:>8.3f}", flush=True)
+
+
+def fork(args):
+    from batch import format_summary
+    from snapshot import MatchSnapshot, simulate_until, aggregate_forks
+    if args.snapshot:
+        snapshot = MatchSnapshot.load(args.snapshot)
+    elif args.at is not None:
+        snapshot = simulate_until(args.config_file, args.at, args.seed, args.dt)
+    else:
+        sys.exit("Either --at or --snapshot must be given")
+    if args.save:
+        snapshot.save(args.save)
+    summary = aggregate_forks(snapshot, args.branches, args.branch_seed, args.workers).summary()
+    summary["snapshot"] = {"time": snapshot.time, "score": snapshot.state["score"]}
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f"Snapshot at {snapshot.time:.2f}s: RED {snapshot.state['score']['RED']} - "
+              f"BLUE {snapshot.state['score']['BLUE']}")
+        print(format_summary(summary))
+
+
+def bench(args):
+    from benchmark import run_benchmarks, default_scenarios, compare_with_baseline, load_results, format_result, \
+        format_header, measure_startup, check_startup, check_equivalence
+    if args.startup:
+        startup = measure_startup()
+        print(f"Headless modules imported in {startup['import_time'] * 1000:.0f}ms "
+              f"(after {startup['numpy_time'] * 1000:.0f}ms importing numpy), "
+              f"arguments parsed in {startup['parse_time'] * 1000:.0f}ms")
+        problems = check_startup(startup)
+        for problem in problems:
+            print(f"Regression: {problem}")
+        if problems:
+            sys.exit(1)
+        return
+    if args.equivalence:
+        bench_equivalence(args.dt)
+        return
+    scenarios = default_scenarios()
+    if args.scenarios:
+        unknown = set(args.scenarios) - {scenario.name for scenario in scenarios}
+        if unknown:
+            sys.exit(f"Unknown benchmark scenarios: {', '.join(sorted(unknown))}")
+        scenarios = [scenario for scenario in scenarios if scenario.name in args.scenarios]
+    print(format_header())
+    results = run_benchmarks(scenarios, args.dt, args.repeats, args.quick,
+                             progress=lambda name, result: print(format_result(name, result), flush=True))
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    if args.baseline:
+        regressions = compare_with_baseline(results, load_results(args.baseline), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+    bench_equivalence(args.dt)
+
+
+def bench_equivalence(dt: float):
+    from benchmark import check_equivalence
+    try:
+        result = check_equivalence(dt)
+    except AssertionError as error:
+        print(f"Regression: {error}")
+        sys.exit(1)
+    print("Vectorized engine matches the tick engine: " +
+          ", ".join(f"{alliance} z={scores['z_score']:+.2f}" for alliance, scores in result.items()))
+
+
+def estimate(args):
+    import time
+    from config import load_config, normalize_config
+    from batch import aggregate_batch
+    from estimator import create_estimator, calibrate
+    config = normalize_config(load_config(args.config_file))
+    report = {}
+    if args.calibrate:
+        report["calibration"] = calibrate(config, args.configs, args.matches, args.seed, args.workers, args.cache_dir)
+    estimator = create_estimator(config, args.cache_dir)
+    started = time.perf_counter()
+    for _ in range(ESTIMATE_REPEATS):
+        report["estimate"] = estimator.estimate(config["robots"])
+    report["estimate_time"] = (time.perf_counter() - started) / ESTIMATE_REPEATS
+    report["factors"] = {"travel_factor": estimator.travel_factor, "variance_factor": estimator.variance_factor}
+    if args.check:
+        engine = "tick" if config["field"]["congestion_penalty"] else "event"
+        summary = aggregate_batch(config, args.check, args.seed, args.workers, engine=engine).summary()
+        report["error"] = {alliance: {key: report["estimate"][alliance][key] - summary[alliance][key]
+                                      for key in ("mean", "std")} for alliance in report["estimate"]}
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    if "calibration" in report:
+        calibration = report["calibration"]
+        print(f"Calibrated on {calibration['configs']} configurations of {calibration['matches']} matches: "
+              f"mean error {calibration['mean_error']:.1%} (max {calibration['max_mean_error']:.1%}), "
+              f"std error {calibration['std_error']:.1%} (max {calibration['max_std_error']:.1%})")
+    print(f"Factors: travel={estimator.travel_factor:.3f} variance={estimator.variance_factor:.3f}")
+    for alliance, stats in report["estimate"].items():
+        line = f"{alliance:<5} mean={stats['mean']:.2f} std={stats['std']:.2f}"
+        if "error" in report:
+            line += f" error: mean={report['error'][alliance]['mean']:+.2f} std={report['error'][alliance]['std']:+.2f}"
+        print(line)
+    print(f"Estimated in {report['estimate_time'] * 1e6:.0f}us")
 
 
 def main():
-    field, bots, match_length = parse_config(parse_args().config_file)
-    pygame.init()
-    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-    pygame.display.set_caption('Rapid React Simulator')
-    field_area = GraphicsArea(screen, (0, 0), SCREEN_WIDTH, SCREEN_WIDTH//2, FIELD_WIDTH, FIELD_HEIGHT)
-    score_area = GraphicsArea(screen, (0, SCREEN_WIDTH//2), SCREEN_WIDTH, SCREEN_HEIGHT-SCREEN_WIDTH//2)
-    total_time = 0.0
-    last_time = time.time()
-    while total_time < match_length:
-        current_time = time.time()
-        dt = current_time - last_time
-        for event in pygame.event.get():
-            if event.type in (QUIT, KEYDOWN):
-                sys.exit()
-        for bot in bots:
-            bot.perform_actions(field, dt)
-        field.update_field(dt)
-        field.score_keeper.update(dt)
-
-        field_area.fill("white")
-        field.draw(field_area)
-        for bot in bots:
-            bot.draw(field_area)
-        field.score_keeper.draw(score_area)
-        pygame.display.flip()
-        total_time += dt
-        last_time = current_time
-
-    while True:
-        for event in pygame.event.get():
-            if event.type in (QUIT, KEYDOWN):
-                sys.exit()
+    args = parse_args()
+    if args.command == "batch":
+        return batch(args)
+    if args.command == "replay":
+        from window import replay
+        return replay(args)
+    if args.command == "sweep":
+        return sweep(args)
+    if args.command == "scenarios":
+        return scenarios(args)
+    if args.command == "fork":
+        return fork(args)
+    if args.command == "bench":
+        return bench(args)
+    if args.command == "estimate":
+        return estimate(args)
+    # The window, and with it pygame, is only imported when needed, so headless commands start fast
+    from window import run
+    run(args)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,143 @@
+from __future__ import annotations
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional, Union
+import numpy as np
+from config import normalize_config, build_normalized_match, ConfigParsingException
+
+COMPILED_CACHE_SIZE = 4096
+# Lines defining shared values instead of scenarios
+DEFAULTS, PROFILE, TEMPLATE = "defaults", "profile", "template"
+
+
+class Scenario:
+    """
+    A validated, normalized configuration, ready to be built into a match without being validated again.
+    key is the hash of the configuration's content, shared by all scenarios resolving to the same configuration.
+    """
+
+    def __init__(self, name: str, config: dict, key: str):
+        self.name = name
+        self.config = config
+        self.key = key
+
+    def __repr__(self):
+        return f"Scenario({self.name!r})"
+
+    @property
+    def num_robots(self) -> int:
+        return len(self.config["robots"])
+
+    def build(self, seed: Union[int, np.random.SeedSequence] = None):
+        return build_normalized_match(self.config, seed)
+
+
+class ScenarioLoader:
+    """
+    Reads a JSON-Lines scenario file, one JSON object per line, and yields its scenarios one at a time.
+
+    Besides scenarios, a line may define shared values used by the scenarios after it:
+    - {"defaults": {"field": {...}, "robot": {...}}} - values every field and robot starts from.
+    - {"profile": "<name>", "extends": "<profile>", ...robot values} - a named robot profile, which a robot picks with
+      "profile": "<name>".
+    - {"template": "<name>", "extends": "<template>", "field": {...}, "robots": [...]} - a named scenario, which a
+      scenario extends with "extends": "<name>".
+    A scenario line is a configuration with an optional "name" and "extends". Its field values override the template's,
+    and its robots, if given, replace the template's.
+    Only the definitions are kept in memory, so the file may hold any number of scenarios.
+    """
+
+    def __init__(self, cache_size: int = COMPILED_CACHE_SIZE):
+        self.defaults = {"field": {}, "robot": {}}
+        self.profiles: Dict[str, dict] = {}
+        self.templates: Dict[str, dict] = {}
+        self.cache_size = cache_size
+        # Normalized configurations by the hash of their content, least recently used first
+        self.compiled: OrderedDict[str, dict] = OrderedDict()
+        self.cache_hits = 0
+
+    def load(self, path: str) -> Iterator[Scenario]:
+        with open(path, "r") as scenario_file:
+            yield from self.parse_lines(scenario_file, path)
+
+    def parse_lines(self, lines, source: str = "<scenarios>") -> Iterator[Scenario]:
+        count = 0
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                scenario = self.parse_record(json.loads(line), f"scenario_{count}")
+            except (ValueError, TypeError, KeyError, IndexError, ConfigParsingException) as e:
+                raise ConfigParsingException(f"{source}:{line_number}: {e}")
+            if scenario:
+                count += 1
+                yield scenario
+
+    def parse_record(self, record: dict, default_name: str) -> Optional[Scenario]:
+        """
+        Handle a single line, returning its scenario or None if it only defined shared values.
+        """
+        if not isinstance(record, dict):
+            raise ConfigParsingException("Every line must be a JSON object")
+        if DEFAULTS in record:
+            for section in ("field", "robot"):
+                self.defaults[section].update(record[DEFAULTS].get(section, {}))
+            return None
+        if PROFILE in record:
+            profile = {key: value for key, value in record.items() if key not in (PROFILE, "extends")}
+            self.profiles[record[PROFILE]] = dict(self.__lookup(self.profiles, record, "profile"), **profile)
+            return None
+        if TEMPLATE in record:
+            self.templates[record[TEMPLATE]] = self.__extend(record)
+            return None
+        return self.compile(record.get("name", default_name), self.resolve(self.__extend(record)))
+
+    def resolve(self, scenario: dict) -> dict:
+        """
+        The plain configuration of a scenario, with the defaults and robot profiles filled in.
+        """
+        robots = []
+        for robot in scenario.get("robots", []):
+            resolved = dict(self.defaults["robot"])
+            if "profile" in robot:
+                resolved.update(self.__lookup(self.profiles, robot, "profile", "profile"))
+            resolved.update((key, value) for key, value in robot.items() if key != "profile")
+            robots.append(resolved)
+        return {"field": dict(self.defaults["field"], **scenario.get("field", {})), "robots": robots}
+
+    def compile(self, name: str, config: dict) -> Scenario:
+        """
+        Validate a resolved configuration into a scenario. Scenarios are keyed on their normalized configuration, so
+        configurations that only differ in how they are written (e.g. 3 and 3.0, or a default written out) share a key
+        and a single compiled configuration.
+        """
+        normalized = normalize_config(config)
+        key = hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+        compiled = self.compiled.get(key)
+        if compiled is None:
+            compiled = normalized
+            self.compiled[key] = compiled
+            if len(self.compiled) > self.cache_size:
+                self.compiled.popitem(last=False)
+        else:
+            self.compiled.move_to_end(key)
+            self.cache_hits += 1
+        return Scenario(name, compiled, key)
+
+    def __extend(self, record: dict) -> dict:
+        template = self.__lookup(self.templates, record, "template")
+        return {"field": dict(template.get("field", {}), **record.get("field", {})),
+                "robots": record.get("robots", template.get("robots", []))}
+
+    @staticmethod
+    def __lookup(definitions: Dict[str, dict], record: dict, kind: str, key: str = "extends") -> dict:
+        if key not in record:
+            return {}
+        if record[key] not in definitions:
+            raise ConfigParsingException(f"Unknown {kind} '{record[key]}'")
+        return definitions[record[key]]
+
+
+def load_scenarios(path: str) -> Iterator[Scenario]:
+    return ScenarioLoader().load(path)
@@ -0,0 +1,82 @@
+from __future__ import annotations
+from math import ceil
+from typing import Dict, List, Union, TYPE_CHECKING
+import numpy as np
+from alliance import Alliance
+from config import load_config, build_match
+from events import EventSimulation
+from recording import MatchRecorder
+from scenarios import Scenario
+if TYPE_CHECKING:
+    from field import Field
+    from robot import Robot
+    # Only the live window publishes telemetry, workers do not pay for importing asyncio
+    from telemetry import TelemetryServer
+
+DEFAULT_DT = 0.02
+ENGINES = ("tick", "event")
+
+
+class MatchResult:
+    def __init__(self, score: Dict[Alliance, int], robot_stats: List[dict], match_length: float):
+        self.score = score
+        self.robot_stats = robot_stats
+        self.match_length = match_length
+
+    def __repr__(self):
+        return f"MatchResult(RED={self.score[Alliance.RED]}, BLUE={self.score[Alliance.BLUE]})"
+
+
+def step(field: Field, robots: List[Robot], dt: float):
+    """
+    Advance the match by a single step of length dt.
+    """
+    field.assign_cargo(robots)
+    for robot in robots:
+        robot.perform_actions(field, dt)
+    field.update_field(dt)
+    field.score_keeper.update(dt)
+
+
+def run_match(field: Field, robots: List[Robot], match_length: float, dt: float = DEFAULT_DT,
+              recorder: MatchRecorder = None, telemetry: TelemetryServer = None):
+    """
+    Run a whole match on a fixed timestep, without any display.
+    The number of steps is computed up front so the match length does not depend on floating point accumulation.
+    """
+    num_steps = ceil(match_length / dt - 1e-9)
+    for i in range(num_steps):
+        step(field, robots, dt)
+        if recorder:
+            recorder.capture(field, (i + 1) * dt)
+        if telemetry:
+            telemetry.publish(field, robots, (i + 1) * dt)
+    if telemetry:
+        telemetry.publish(field, robots, num_steps * dt, force=True)
+
+
+def simulate(config: Union[str, dict, Scenario], seed: Union[int, np.random.SeedSequence] = None, dt: float = DEFAULT_DT,
+             engine: str = "tick", record_path: str = None, telemetry: TelemetryServer = None) -> MatchResult:
+    """
+    Simulate a single match headlessly and return its final score and per-robot stats.
+    config is either a path to a JSON configuration, an already loaded configuration dict or a compiled scenario.
+    The "tick" engine advances the match on a fixed timestep of dt, while the "event" engine jumps from one action
+    completion to the next and ignores dt.
+    If record_path is given, the match is recorded into it, and if a started telemetry server is given, the match is
+    published through it (both only supported by the "tick" engine).
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown simulation engine '{engine}'")
+    if (record_path or telemetry) and engine != "tick":
+        raise ValueError("Matches can only be recorded or published by the tick engine")
+    if isinstance(config, str):
+        config = load_config(config)
+    field, robots, match_length = config.build(seed) if isinstance(config, Scenario) else build_match(config, seed)
+    if engine == "event":
+        EventSimulation(field, robots, match_length).run()
+    else:
+        recorder = MatchRecorder(record_path, field, robots, match_length, dt=dt) if record_path else None
+        run_match(field, robots, match_length, dt, recorder, telemetry)
+        if recorder:
+            recorder.close()
+    return MatchResult(dict(field.score_keeper.score), [robot.get_stats() for robot in robots], match_length)
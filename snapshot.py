@@ -0,0 +1,215 @@
+from __future__ import annotations
+import json
+import os
+import zlib
+from collections import deque
+from math import ceil
+from concurrent.futures import Executor
+from contextlib import nullcontext
+from typing import List, Union, TYPE_CHECKING
+import numpy as np
+from alliance import Alliance
+from batch import seed_chunks, ordered_map, optional_pool, MAX_MATCHES_PER_TASK, TASKS_PER_WORKER
+from cargo import CargoPool
+from config import load_config, normalize_config, build_normalized_match, match_streams
+from results import ResultSink
+from robot import Path
+from simulation import MatchResult, step, DEFAULT_DT
+from spatial import CargoIndex
+if TYPE_CHECKING:
+    from field import Field
+    from robot import Robot
+
+SNAPSHOT_VERSION = 1
+
+
+class MatchSnapshot:
+    """
+    The full state of a match in the middle of a tick engine run, as plain data: the normalized configuration, scores,
+    hub contents, floor cargo (by pool slot, in the order the cargo indexes hold it), every robot's state and path, and
+    the state of every random generator.
+    Being plain data it can be pickled to workers, written to a file with dumps(), or edited to ask what-if questions
+    (e.g. giving a robot an extra scored shot) before being restored.
+    """
+
+    def __init__(self, state: dict):
+        self.state = state
+
+    @property
+    def time(self) -> float:
+        return self.state["time"]
+
+    @classmethod
+    def capture(cls, config: dict, field: Field, robots: List[Robot], match_length: float, steps: int,
+                dt: float) -> MatchSnapshot:
+        spawner = field.spawner
+        state = {
+            "version": SNAPSHOT_VERSION,
+            "config": normalize_config(config),
+            "match_length": match_length,
+            "dt": dt,
+            "steps": steps,
+            "time": field.score_keeper.time,
+            "hub_time": field.hub.time,
+            "score": {alliance.value: score for alliance, score in field.score_keeper.score.items()},
+            "hub": {alliance.value: list(timeouts) for alliance, timeouts in field.hub.cargo_timeouts.items()},
+            "pool": {"capacity": field.cargo_pool.capacity, "free": list(field.cargo_pool.free)},
+            "floor_cargo": [[cargo.index, cargo.x, cargo.y, cargo.alliance.value, cargo.is_selected]
+                            for cargo in field.floor_cargo],
+            "selectable_cargo": {alliance.value: [cargo.index for cargo in index]
+                                 for alliance, index in field.selectable_cargo.items()},
+            "spawner": {"rng": spawner.rng.bit_generator.state, "xs": list(spawner.xs), "ys": list(spawner.ys),
+                        "next_idx": spawner.next_idx},
+            "robots": [cls.__robot_state(robot) for robot in robots],
+        }
+        return cls(state)
+
+    @staticmethod
+    def __robot_state(robot: Robot) -> dict:
+        path = robot.path
+        return {
+            "position": [robot.x, robot.y],
+            "num_cargo": robot.num_cargo,
+            "cargo_collected": robot.cargo_collected,
+            "shots_made": robot.shots_made,
+            "shots_missed": robot.shots_missed,
+            "action_time": robot.action_time,
+            "current_action": robot.current_action,
+            "post_action_time": robot.post_action_time,
+            "selected_cargo": robot.selected_cargo.index if robot.selected_cargo is not None else None,
+            "path": {"points": [list(point) for point in path.points], "position": [path.x, path.y],
+                     "next_point_idx": path.next_point_idx, "done": path.done} if path else None,
+            "rng": robot.rng.bit_generator.state,
+            "shot_draws": list(robot.shot_draws),
+            "next_shot_draw": robot.next_shot_draw,
+        }
+
+    def restore(self, seed: Union[int, np.random.SeedSequence] = None):
+        """
+        Rebuild the match, returning (field, robots, match_length) like config.build_match.
+        Without a seed the match continues exactly as it would have without the snapshot. With a seed, all random
+        generators are replaced by new streams spawned from it, so different seeds fork different continuations.
+        """
+        state = self.state
+        field, robots, match_length = build_normalized_match(state["config"])
+
+        pool = CargoPool(state["pool"]["capacity"])
+        pool.free = list(state["pool"]["free"])
+        field.spawner.pool = field.cargo_pool = pool
+        field.floor_cargo = set()
+        field.selectable_cargo = {Alliance.RED: CargoIndex(), Alliance.BLUE: CargoIndex()}
+        for index, x, y, alliance, is_selected in state["floor_cargo"]:
+            cargo = pool.cargo[index]
+            cargo.x, cargo.y, cargo.alliance, cargo.is_selected = x, y, Alliance(alliance), is_selected
+            field.floor_cargo.add(cargo)
+        for alliance, indices in state["selectable_cargo"].items():
+            for index in indices:
+                field.selectable_cargo[Alliance(alliance)].add(pool.cargo[index])
+
+        field.hub.time = state["hub_time"]
+        field.hub.cargo_timeouts = {Alliance(alliance): deque(timeouts) for alliance, timeouts in state["hub"].items()}
+        field.score_keeper.time = state["time"]
+        field.score_keeper.score = {Alliance(alliance): score for alliance, score in state["score"].items()}
+
+        for robot, robot_state in zip(robots, state["robots"]):
+            robot.position = tuple(robot_state["position"])
+            for key in ("num_cargo", "cargo_collected", "shots_made", "shots_missed", "action_time", "current_action",
+                        "post_action_time", "next_shot_draw"):
+                setattr(robot, key, robot_state[key])
+            robot.shot_draws = list(robot_state["shot_draws"])
+            selected = robot_state["selected_cargo"]
+            robot.selected_cargo = pool.cargo[selected] if selected is not None else None
+            path_state = robot_state["path"]
+            robot.path = None
+            if path_state:
+                robot.path = Path([tuple(point) for point in path_state["points"]])
+                robot.path.position = tuple(path_state["position"])
+                robot.path.next_point_idx, robot.path.done = path_state["next_point_idx"], path_state["done"]
+            robot.rng.bit_generator.state = robot_state["rng"]
+
+        if field.congestion:
+            field.congestion.track(robots)
+
+        spawner = field.spawner
+        spawner.rng.bit_generator.state = state["spawner"]["rng"]
+        spawner.xs, spawner.ys = list(state["spawner"]["xs"]), list(state["spawner"]["ys"])
+        spawner.next_idx = state["spawner"]["next_idx"]
+
+        if seed is not None:
+            spawner_rng, *robot_rngs = match_streams(seed, 1 + len(robots))
+            spawner.rng, spawner.xs, spawner.ys, spawner.next_idx = spawner_rng, [], [], 0
+            for robot, rng in zip(robots, robot_rngs):
+                robot.rng, robot.shot_draws, robot.next_shot_draw = rng, [], 0
+        return field, robots, match_length
+
+    def dumps(self) -> bytes:
+        return zlib.compress(json.dumps(self.state).encode())
+
+    @classmethod
+    def loads(cls, data: bytes) -> MatchSnapshot:
+        state = json.loads(zlib.decompress(data))
+        if state["version"] != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {state['version']}")
+        return cls(state)
+
+    def save(self, path: str):
+        with open(path, "wb") as snapshot_file:
+            snapshot_file.write(self.dumps())
+
+    @classmethod
+    def load(cls, path: str) -> MatchSnapshot:
+        with open(path, "rb") as snapshot_file:
+            return cls.loads(snapshot_file.read())
+
+
+def simulate_until(config: Union[str, dict], time: float, seed: int = None, dt: float = DEFAULT_DT) -> MatchSnapshot:
+    """
+    Simulate the beginning of a match on the tick engine and snapshot it at time (rounded down to a whole step).
+    """
+    if isinstance(config, str):
+        config = load_config(config)
+    field, robots, match_length = build_normalized_match(normalize_config(config), seed)
+    steps = min(int(time / dt + 1e-9), ceil(match_length / dt - 1e-9))
+    for _ in range(steps):
+        step(field, robots, dt)
+    return MatchSnapshot.capture(config, field, robots, match_length, steps, dt)
+
+
+def continue_match(snapshot: MatchSnapshot, seed: Union[int, np.random.SeedSequence] = None) -> MatchResult:
+    """
+    Run the rest of a snapshot's match on the tick engine, with the snapshot's timestep.
+    """
+    field, robots, match_length = snapshot.restore(seed)
+    dt = snapshot.state["dt"]
+    for _ in range(ceil(match_length / dt - 1e-9) - snapshot.state["steps"]):
+        step(field, robots, dt)
+    return MatchResult(dict(field.score_keeper.score), [robot.get_stats() for robot in robots], match_length)
+
+
+def aggregate_branches(snapshot: MatchSnapshot, seeds: List[np.random.SeedSequence]) -> ResultSink:
+    sink = ResultSink()
+    scores = np.empty((len(seeds), 2), dtype=np.int64)
+    for i, seed in enumerate(seeds):
+        result = continue_match(snapshot, seed)
+        scores[i] = result.score[Alliance.RED], result.score[Alliance.BLUE]
+        sink.add_robot_stats(result.robot_stats)
+    sink.add_scores(scores)
+    return sink
+
+
+def aggregate_forks(snapshot: MatchSnapshot, num_branches: int, master_seed: int = 0, workers: int = None,
+                    executor: Executor = None) -> ResultSink:
+    """
+    Fork num_branches continuations of the snapshot across a process pool, each with its own random streams, and
+    aggregate their results into a ResultSink as they come in, like batch.aggregate_batch.
+    """
+    workers = workers or os.cpu_count()
+    chunk_size = max(1, min(MAX_MATCHES_PER_TASK, ceil(num_branches / (workers * TASKS_PER_WORKER))))
+    tasks = ((snapshot, seeds) for seeds in seed_chunks(master_seed, num_branches, chunk_size))
+    sink = ResultSink()
+    with optional_pool(executor, workers) if workers > 1 or executor else nullcontext() as pool:
+        results = ordered_map(pool, aggregate_branches, tasks, workers * TASKS_PER_WORKER) if pool else \
+            (aggregate_branches(*task) for task in tasks)
+        for partial in results:
+            sink.merge(partial)
+    return sink
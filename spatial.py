@@ -0,0 +1,158 @@
+from __future__ import annotations
+from math import floor
+from typing import Callable, Dict, List, Tuple, TYPE_CHECKING
+from cargo import FIELD_WIDTH, FIELD_HEIGHT
+if TYPE_CHECKING:
+    from cargo import Cargo
+    from robot import Robot
+
+
+class CargoIndex:
+    """
+    Uniform grid over the field holding cargo that can still be selected.
+    Nearest cargo queries search the grid outward, ring by ring, around the queried position.
+    """
+    CELL_SIZE = 1.0
+
+    def __init__(self, cell_size: float = CELL_SIZE):
+        self.cell_size = cell_size
+        self.columns = max(1, int(FIELD_WIDTH // cell_size) + 1)
+        self.rows = max(1, int(FIELD_HEIGHT // cell_size) + 1)
+        self.cells: Dict[Tuple[int, int], List[Cargo]] = {}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for cell in self.cells.values():
+            yield from cell
+
+    def add(self, cargo: Cargo):
+        self.cells.setdefault(self.__cell_of(cargo.x, cargo.y), []).append(cargo)
+        self.size += 1
+
+    def remove(self, cargo: Cargo):
+        key = self.__cell_of(cargo.x, cargo.y)
+        cell = self.cells[key]
+        cell.remove(cargo)
+        if not cell:
+            del self.cells[key]
+        self.size -= 1
+
+    def nearest(self, position: Tuple[float, float], metric: Callable[[Tuple[float, float], Cargo], float] = None):
+        """
+        Return the cargo nearest to position, or None if the index is empty.
+        By default the euclidean distance is used; a custom metric must never be smaller than the euclidean distance,
+        which is what makes stopping the search early correct.
+        """
+        if not self.size:
+            return None
+        x, y = position
+        center_column, center_row = self.__cell_of(x, y)
+        max_ring = max(center_column, self.columns - 1 - center_column, center_row, self.rows - 1 - center_row)
+        best, best_distance = None, float("inf")
+        for ring in range(max_ring + 1):
+            # Every cell of this ring is at least (ring - 1) cells away from the position
+            if best is not None and best_distance <= (ring - 1) * self.cell_size:
+                break
+            for key in self.__ring(center_column, center_row, ring):
+                for cargo in self.cells.get(key, ()):
+                    if metric:
+                        distance = metric(position, cargo)
+                    else:
+                        distance = ((cargo.x - x) ** 2 + (cargo.y - y) ** 2) ** 0.5
+                    if distance < best_distance:
+                        best, best_distance = cargo, distance
+        return best
+
+    def __cell_of(self, x: float, y: float) -> Tuple[int, int]:
+        column = min(max(floor(x / self.cell_size), 0), self.columns - 1)
+        row = min(max(floor(y / self.cell_size), 0), self.rows - 1)
+        return column, row
+
+    @staticmethod
+    def __ring(center_column: int, center_row: int, ring: int):
+        if ring == 0:
+            yield center_column, center_row
+            return
+        for column in range(center_column - ring, center_column + ring + 1):
+            yield column, center_row - ring
+            yield column, center_row + ring
+        for row in range(center_row - ring + 1, center_row + ring):
+            yield center_column - ring, row
+            yield center_column + ring, row
+
+
+class RobotIndex:
+    """
+    Spatial hash of robot positions, updated incrementally as robots move.
+    With cells as large as the queried radius, a query only looks at the 3x3 cells around the queried position.
+    """
+
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], List[Robot]] = {}
+        self.robot_cells: Dict[Robot, Tuple[int, int]] = {}
+
+    def __len__(self):
+        return len(self.robot_cells)
+
+    def add(self, robot: Robot):
+        key = self.__cell_of(robot.x, robot.y)
+        self.robot_cells[robot] = key
+        self.cells.setdefault(key, []).append(robot)
+
+    def move(self, robot: Robot):
+        """
+        Update the robot's cell after its position changed.
+        """
+        key = self.__cell_of(robot.x, robot.y)
+        old_key = self.robot_cells[robot]
+        if key == old_key:
+            return
+        cell = self.cells[old_key]
+        cell.remove(robot)
+        if not cell:
+            del self.cells[old_key]
+        self.robot_cells[robot] = key
+        self.cells.setdefault(key, []).append(robot)
+
+    def count_within(self, position: Tuple[float, float], radius: float, exclude: Robot = None) -> int:
+        x, y = position
+        squared_radius = radius * radius
+        first_column, first_row = self.__cell_of(x - radius, y - radius)
+        last_column, last_row = self.__cell_of(x + radius, y + radius)
+        count = 0
+        for column in range(first_column, last_column + 1):
+            for row in range(first_row, last_row + 1):
+                for robot in self.cells.get((column, row), ()):
+                    if robot is not exclude and (robot.x - x) ** 2 + (robot.y - y) ** 2 <= squared_radius:
+                        count += 1
+        return count
+
+    def __cell_of(self, x: float, y: float) -> Tuple[int, int]:
+        return floor(x / self.cell_size), floor(y / self.cell_size)
+
+
+class Congestion:
+    """
+    Robots work slower near other robots: every other robot within radius adds penalty to the time the robot takes to
+    collect and shoot, and divides its velocity accordingly.
+    """
+
+    def __init__(self, penalty: float, radius: float):
+        self.penalty = penalty
+        self.radius = radius
+        self.robots = RobotIndex(radius)
+
+    def track(self, robots: List[Robot]):
+        self.robots = RobotIndex(self.radius)
+        for robot in robots:
+            self.robots.add(robot)
+
+    def move(self, robot: Robot):
+        self.robots.move(robot)
+
+    def factor(self, robot: Robot) -> float:
+        return 1.0 + self.penalty * self.robots.count_within((robot.x, robot.y), self.radius, robot)
@@ -0,0 +1,113 @@
+from __future__ import annotations
+import copy
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from typing import Dict, List, Tuple, Union
+import numpy as np
+from batch import aggregate_batch
+from config import load_config, normalize_config, ConfigParsingException
+from simulation import DEFAULT_DT
+
+CACHE_DIR = ".rrsim_cache"
+# Bump whenever a change to the simulation changes its results, so that results cached before it are not reused
+CACHE_VERSION = 3
+
+
+def parse_parameter(spec: str) -> Tuple[str, List[float]]:
+    """
+    Parse a swept parameter of the form "<path>=<values>".
+    The path is dot separated, e.g. "robots.0.collect_time", "robots.*.accuracy" or "field.cargo_hub_timeout".
+    Values are either a comma separated list ("0.7,0.8,0.9") or an evenly spaced range "<start>:<stop>:<count>".
+    """
+    if "=" not in spec:
+        raise ConfigParsingException(f"Swept parameter '{spec}' must be of the form <path>=<values>")
+    path, values = spec.split("=", 1)
+    if values.count(":") == 2:
+        start, stop, count = values.split(":")
+        return path, [float(value) for value in np.linspace(float(start), float(stop), int(count))]
+    return path, [float(value) for value in values.split(",")]
+
+
+def set_parameter(config: dict, path: str, value: float):
+    *parents, key = path.split(".")
+    targets = [config]
+    for part in parents:
+        if part == "*":
+            targets = [item for target in targets for item in target]
+        else:
+            targets = [target[int(part)] if isinstance(target, list) else target[part] for target in targets]
+    for target in targets:
+        if key not in target:
+            raise ConfigParsingException(f"Swept parameter '{path}' does not exist in the configuration")
+        target[key] = value
+
+
+def distribution_digest(path: str) -> str:
+    """
+    Hash of the contents of a cargo distribution file, which may change under the same path.
+    """
+    try:
+        with open(path, "rb") as dist_file:
+            return hashlib.sha256(dist_file.read()).hexdigest()
+    except OSError as e:
+        raise ConfigParsingException(f"Invalid cargo distribution '{path}': {e}")
+
+
+def cache_key(config: dict, master_seed: int, num_matches: int, dt: float, engine: str) -> str:
+    normalized_config = normalize_config(config)
+    normalized = json.dumps({"version": CACHE_VERSION, "config": normalized_config,
+                             "distribution": distribution_digest(normalized_config["field"]["cargo_distribution"]), "seed": master_seed,
+                             "matches": num_matches, "dt": dt, "engine": engine}, sort_keys=True)
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def run_sweep(config: Union[str, dict], parameters: List[Tuple[str, List[float]]], num_matches: int,
+              master_seed: int = 0, workers: int = None, dt: float = DEFAULT_DT, engine: str = "tick",
+              cache_dir: str = CACHE_DIR) -> List[Dict]:
+    """
+    Evaluate every point of the grid spanned by parameters over num_matches matches.
+    All grid points use the same match seeds (common random numbers), so differences between them are not drowned in
+    match to match noise. Results are cached on the disk by the normalized configuration, the contents of its cargo
+    distribution and the seed, so rerunning an overlapping sweep only simulates the new points.
+    """
+    if isinstance(config, str):
+        config = load_config(config)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for values in product(*(values for _, values in parameters)):
+            point_config = copy.deepcopy(config)
+            for (path, _), value in zip(parameters, values):
+                set_parameter(point_config, path, value)
+            key = cache_key(point_config, master_seed, num_matches, dt, engine)
+            cache_path = os.path.join(cache_dir, f"{key}.json") if cache_dir else None
+            if cache_path and os.path.exists(cache_path):
+                with open(cache_path, "r") as cache_file:
+                    summary = json.load(cache_file)
+            else:
+                summary = aggregate_batch(point_config, num_matches, master_seed, workers, dt, engine,
+                                          executor=executor).summary()
+                if cache_path:
+                    with open(cache_path, "w") as cache_file:
+                        json.dump(summary, cache_file)
+            results.append({"parameters": dict(zip((path for path, _ in parameters), values)), "summary": summary})
+    return results
+
+
+def format_sweep(results: List[Dict]) -> str:
+    if not results:
+        return ""
+    names = list(results[0]["parameters"])
+    header = " ".join(f"{name:>24}" for name in names) + f" {'RED mean':>9} {'BLUE mean':>9} {'RED win':>8} {'BLUE win':>8}"
+    lines = [header]
+    for result in results:
+        summary = result["summary"]
+        values = " ".join(f"{value:>24.4g}" for value in result["parameters"].values())
+        lines.append(f"{values} {summary['RED']['mean']:>9.2f} {summary['BLUE']['mean']:>9.2f} "
+                     f"{summary['RED']['win_rate']:>8.3f} {summary['BLUE']['win_rate']:>8.3f}")
+    return "\n".join(lines)
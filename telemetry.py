@@ -0,0 +1,148 @@
+from __future__ import annotations
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from typing import List, Set, TYPE_CHECKING
+from alliance import Alliance
+if TYPE_CHECKING:
+    from field import Field
+    from robot import Robot
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Snapshots per second of wall time
+DEFAULT_RATE = 10.0
+# Snapshots waiting to be sent out, older ones are dropped when the server falls behind
+QUEUE_SIZE = 4
+# Snapshots buffered for every client, a lagging client skips to the newest one
+CLIENT_BUFFER = 1
+# Longest wait for the last snapshots to reach the clients when stopping
+SHUTDOWN_TIMEOUT = 1.0
+ACTION_NAMES = ("select", "drive", "collect", "shoot")
+
+
+def snapshot(field: Field, robots: List[Robot], match_time: float) -> dict:
+    floor = {Alliance.RED.value: 0, Alliance.BLUE.value: 0}
+    for cargo in field.floor_cargo:
+        floor[cargo.alliance.value] += 1
+    return {
+        "time": match_time,
+        "score": {alliance.value: score for alliance, score in field.score_keeper.score.items()},
+        "robots": [{"alliance": robot.alliance.value, "position": [robot.x, robot.y],
+                    "action": ACTION_NAMES[robot.current_action], "num_cargo": robot.num_cargo} for robot in robots],
+        "floor_cargo": floor,
+        "hub_cargo": {alliance.value: len(timeouts) for alliance, timeouts in field.hub.cargo_timeouts.items()},
+    }
+
+
+class TelemetryServer:
+    """
+    Publishes snapshots of a running match as JSON lines to every client connected over TCP.
+    The server runs an asyncio event loop on a thread of its own. The simulation only appends snapshots to a bounded
+    queue, at most rate times per second, so it never waits for the network or for slow clients.
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, rate: float = DEFAULT_RATE):
+        self.host = host
+        self.port = port
+        self.rate = rate
+        # Appending to a bounded deque is atomic and drops the oldest snapshot when full
+        self.pending = deque(maxlen=QUEUE_SIZE)
+        self.clients: Set[asyncio.Queue] = set()
+        self.last_publish = None
+        self.loop = None
+        self.thread = None
+        self.started = threading.Event()
+        self.startup_error = None
+
+    def __enter__(self) -> TelemetryServer:
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.__run, name="telemetry", daemon=True)
+        self.thread.start()
+        self.started.wait()
+        if self.startup_error:
+            raise self.startup_error
+
+    def stop(self):
+        if self.loop and self.thread.is_alive():
+            asyncio.run_coroutine_threadsafe(self.__shutdown(), self.loop)
+            self.thread.join()
+
+    def publish(self, field: Field, robots: List[Robot], match_time: float, force: bool = False):
+        """
+        Queue a snapshot of the match if one is due. Called by the simulation loop after every step.
+        """
+        now = time.perf_counter()
+        if not force and self.last_publish is not None and now - self.last_publish < 1 / self.rate:
+            return
+        self.last_publish = now
+        self.pending.append(snapshot(field, robots, match_time))
+
+    def __run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            server = self.loop.run_until_complete(asyncio.start_server(self.__serve_client, self.host, self.port))
+        except OSError as e:
+            self.startup_error = e
+            self.started.set()
+            return
+        # The actual port, in case port 0 asked for any free one
+        self.port = server.sockets[0].getsockname()[1]
+        self.started.set()
+        self.loop.create_task(self.__broadcast())
+        try:
+            self.loop.run_forever()
+        finally:
+            server.close()
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, server.wait_closed(), return_exceptions=True))
+            self.loop.close()
+
+    def __send_pending(self):
+        while self.pending:
+            line = (json.dumps(self.pending.popleft()) + "\n").encode()
+            for client in self.clients:
+                if client.full():
+                    # The client did not keep up, its stale snapshot is replaced by the newest one
+                    client.get_nowait()
+                client.put_nowait(line)
+
+    async def __broadcast(self):
+        while True:
+            self.__send_pending()
+            await asyncio.sleep(1 / self.rate)
+
+    async def __shutdown(self):
+        self.__send_pending()
+        deadline = self.loop.time() + SHUTDOWN_TIMEOUT
+        while any(not client.empty() for client in self.clients) and self.loop.time() < deadline:
+            await asyncio.sleep(0.01)
+        self.loop.stop()
+
+    async def __serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = asyncio.Queue(maxsize=CLIENT_BUFFER)
+        self.clients.add(client)
+        try:
+            while True:
+                writer.write(await client.get())
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.clients.discard(client)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, asyncio.CancelledError):
+                pass
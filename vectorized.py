@@ -0,0 +1,275 @@
+from __future__ import annotations
+import argparse
+from math import ceil
+from typing import Union
+import numpy as np
+from alliance import Alliance
+from config import load_config, build_match
+from robot import Robot, plan_path, travel_distances, OBSTACLE_LEFT, OBSTACLE_RIGHT, OBSTACLE_BOTTOM, OBSTACLE_TOP
+from scenarios import Scenario
+
+MAX_PATH_POINTS = 4
+# Mean scores of the two engines further apart than this many standard errors fail check_against_scalar
+MAX_Z_SCORE = 4.0
+
+
+class VectorizedSimulation:
+    """
+    Structure-of-arrays engine advancing many independent matches of the same configuration in lockstep.
+    The state of every robot and every cargo of all matches lives in NumPy arrays, and the robot cycle, path traversal
+    and hub timeouts are applied as array operations across all robots of all matches at once.
+    It follows the semantics of Robot and Field tick by tick, but draws its random numbers differently, so it only
+    reproduces the scalar engine statistically.
+    """
+    FLOOR, SELECTED, CARRIED, HUB = range(4)
+
+    def __init__(self, config: Union[str, dict, Scenario], num_matches: int,
+                 seed: Union[int, np.random.SeedSequence] = None):
+        if isinstance(config, str):
+            config = load_config(config)
+        field, robots, self.match_length = config.build() if isinstance(config, Scenario) else build_match(config)
+        if field.assignment.batched:
+            raise ValueError("The vectorized engine only supports the nearest cargo assignment")
+        if field.congestion:
+            raise ValueError("The vectorized engine does not support congestion")
+        self.rng = np.random.default_rng(seed)
+        self.distribution = field.spawner.distribution
+        self.cargo_hub_timeout = field.hub.cargo_hub_timeout
+        self.num_matches = m = num_matches
+        self.num_robots = r = len(robots)
+        self.time = 0.0
+
+        # Robot parameters, shared by all matches
+        self.collect_time = np.array([robot.collect_time for robot in robots])
+        self.shoot_time = np.array([robot.shoot_time for robot in robots])
+        self.velocity = np.array([robot.velocity for robot in robots])
+        self.accuracy = np.array([robot.accuracy for robot in robots])
+        self.score_column = np.array([0 if robot.alliance == Alliance.RED else 1 for robot in robots])
+
+        # Cargo slots, the first num_cargo of every match are RED and the rest are BLUE
+        num_cargo = field.num_cargo
+        self.num_slots = 2 * num_cargo
+        # Whether every robot may select every slot
+        self.own_slots = np.zeros((r, self.num_slots), dtype=bool)
+        for robot, column in enumerate(self.score_column):
+            self.own_slots[robot, column * num_cargo:(column + 1) * num_cargo] = True
+        x, y = self.distribution.sample(m * self.num_slots, self.rng)
+        self.cargo_x = x.reshape(m, self.num_slots)
+        self.cargo_y = y.reshape(m, self.num_slots)
+        self.cargo_state = np.full((m, self.num_slots), self.FLOOR, dtype=np.int8)
+        # Cargo in the hub is released at its time, all other cargo never is
+        self.cargo_release = np.full((m, self.num_slots), np.inf)
+        self.next_release = np.inf
+
+        # Robot state, of all robots of all matches one after another so that robot i is robot i % r of match i // r
+        self.match_of = np.repeat(np.arange(m), r)
+        self.robot_of = np.tile(np.arange(r), m)
+        self.position = np.tile(np.array([robot.position for robot in robots], dtype=float), (m, 1))
+        self.action = np.full(m * r, Robot.SELECT, dtype=np.int8)
+        self.action_time = np.zeros(m * r)
+        self.target = np.zeros(m * r, dtype=np.int64)
+        self.path_points = np.zeros((m * r, MAX_PATH_POINTS, 2))
+        self.path_length = np.zeros(m * r, dtype=np.int64)
+        self.path_next = np.zeros(m * r, dtype=np.int64)
+
+        self.score = np.zeros((m, 2), dtype=np.int64)
+        self.shots_made = np.zeros(m * r, dtype=np.int64)
+        self.shots_missed = np.zeros(m * r, dtype=np.int64)
+
+    def run(self, dt: float):
+        num_steps = ceil(self.match_length / dt - 1e-9)
+        for _ in range(num_steps):
+            self.step(dt)
+
+    def step(self, dt: float):
+        # Every robot of every match goes through its cycle at once, each with the time left of its step
+        remaining = np.full(self.num_matches * self.num_robots, dt)
+        self.__select(remaining)
+        self.__drive(remaining)
+        self.__collect(remaining)
+        self.__shoot(remaining)
+
+        # The hub's clock only advances after all robots acted, just like Field.update_field
+        self.time += dt
+        if self.time >= self.next_release:
+            matches, slots = np.nonzero(self.cargo_release <= self.time)
+            self.cargo_release[matches, slots] = np.inf
+            self.__respawn(matches, slots)
+            self.next_release = self.cargo_release.min()
+
+    def __select(self, remaining: np.ndarray):
+        selecting = np.flatnonzero(self.action == Robot.SELECT)
+        while len(selecting):
+            matches = self.match_of[selecting]
+            position = self.position[selecting]
+            distances = travel_distances(position[:, 0:1], position[:, 1:2],
+                                         self.cargo_x[matches], self.cargo_y[matches])
+            distances[~self.own_slots[self.robot_of[selecting]] | (self.cargo_state[matches] != self.FLOOR)] = np.inf
+            nearest = distances.argmin(axis=1)
+            found = np.isfinite(distances[np.arange(len(selecting)), nearest])
+
+            # Robots without available cargo wait for the rest of the step
+            remaining[selecting[~found]] = 0.0
+            selecting, nearest = selecting[found], nearest[found]
+            # Robots act in order in the scalar engine, so of the robots wanting the same cargo the first one gets it,
+            # and the others select again among the cargo left. Robots are in order already, so a stable sort on the
+            # cargo keeps the first robot wanting every cargo first.
+            cargo = self.match_of[selecting] * self.num_slots + nearest
+            order = np.argsort(cargo, kind="stable")
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = cargo[order[1:]] != cargo[order[:-1]]
+            winners = order[first]
+            self.__start_driving(selecting[winners], nearest[winners])
+            selecting = np.sort(selecting[order[~first]])
+
+    def __start_driving(self, robots: np.ndarray, cargo: np.ndarray):
+        matches = self.match_of[robots]
+        self.cargo_state[matches, cargo] = self.SELECTED
+        self.target[robots] = cargo
+        self.action[robots] = Robot.DRIVE
+        self.path_next[robots] = 1
+        start = self.position[robots]
+        end = np.column_stack((self.cargo_x[matches, cargo], self.cargo_y[matches, cargo]))
+        self.path_points[robots, 0] = start
+        self.path_points[robots, 1] = end
+        self.path_length[robots] = 2
+        # Only paths whose bounding box overlaps the obstacle may have to go around it, those are planned one by one
+        maybe_blocked = (np.maximum(start[:, 0], end[:, 0]) > OBSTACLE_LEFT) & \
+                        (np.minimum(start[:, 0], end[:, 0]) < OBSTACLE_RIGHT) & \
+                        (np.maximum(start[:, 1], end[:, 1]) > OBSTACLE_BOTTOM) & \
+                        (np.minimum(start[:, 1], end[:, 1]) < OBSTACLE_TOP)
+        for robot in robots[maybe_blocked].tolist():
+            start_point, end_point = self.path_points[robot, :2].tolist()
+            points = plan_path(tuple(start_point), tuple(end_point)).points
+            self.path_points[robot, :len(points)] = points
+            self.path_length[robot] = len(points)
+
+    def __drive(self, remaining: np.ndarray):
+        driving = np.flatnonzero((self.action == Robot.DRIVE) & (remaining > 0))
+        # Every pass moves the robots still driving towards their next point, so it shrinks to those that reached it
+        for _ in range(MAX_PATH_POINTS - 1):
+            if not len(driving):
+                break
+            next_index = self.path_next[driving]
+            next_point = self.path_points[driving, next_index]
+            delta = next_point - self.position[driving]
+            target_distance = np.sqrt((delta ** 2).sum(axis=1))
+            velocity = self.velocity[self.robot_of[driving]]
+            step_time = remaining[driving]
+            possible_distance = velocity * step_time
+            arrived = possible_distance >= target_distance
+
+            # Robots that cannot arrive at their next point move towards it and use up their step
+            partial = driving[~arrived]
+            proportion = possible_distance[~arrived] / target_distance[~arrived]
+            self.position[partial] += delta[~arrived] * proportion[:, None]
+            remaining[partial] = 0.0
+
+            driving = driving[arrived]
+            self.position[driving] = next_point[arrived]
+            next_index = next_index[arrived] + 1
+            self.path_next[driving] = next_index
+            step_time = step_time[arrived] - target_distance[arrived] / velocity[arrived]
+            remaining[driving] = step_time
+
+            done = next_index == self.path_length[driving]
+            self.action[driving[done]] = Robot.COLLECT
+            self.action_time[driving[done]] = 0.0
+            driving = driving[~done & (step_time > 0)]
+
+    def __collect(self, remaining: np.ndarray):
+        collecting = np.flatnonzero((self.action == Robot.COLLECT) & (remaining > 0))
+        if not len(collecting):
+            return
+        collected = self.__advance_timer(collecting, remaining, self.collect_time)
+        self.cargo_state[self.match_of[collected], self.target[collected]] = self.CARRIED
+        self.action[collected] = Robot.SHOOT
+
+    def __shoot(self, remaining: np.ndarray):
+        shooting = np.flatnonzero((self.action == Robot.SHOOT) & (remaining > 0))
+        if not len(shooting):
+            return
+        shot = self.__advance_timer(shooting, remaining, self.shoot_time)
+        if not len(shot):
+            return
+        matches, cargo = self.match_of[shot], self.target[shot]
+        hit = self.rng.random(len(shot)) <= self.accuracy[self.robot_of[shot]]
+
+        scored = matches[hit], cargo[hit]
+        self.cargo_state[scored] = self.HUB
+        self.cargo_release[scored] = self.time + self.cargo_hub_timeout
+        self.next_release = min(self.next_release, self.time + self.cargo_hub_timeout)
+        # Robots of the same alliance may score in the same match and step
+        np.add.at(self.score, (matches[hit], self.score_column[self.robot_of[shot[hit]]]), 2)
+        self.shots_made[shot[hit]] += 1
+
+        self.__respawn(matches[~hit], cargo[~hit])
+        self.shots_missed[shot[~hit]] += 1
+        self.action[shot] = Robot.SELECT
+
+    def __advance_timer(self, robots: np.ndarray, remaining: np.ndarray, durations: np.ndarray) -> np.ndarray:
+        """
+        Advance the timed action of the given robots, returning those where it finished.
+        Like Robot.collect_ball and Robot.shoot_ball, the action uses up the rest of the step either way.
+        """
+        action_time = self.action_time[robots]
+        starting = action_time == 0
+        action_time[starting] = durations[self.robot_of[robots[starting]]]
+        step_time = remaining[robots]
+        finished = step_time >= action_time
+        self.action_time[robots] = np.where(finished, 0.0, action_time - step_time)
+        remaining[robots] = 0.0
+        return robots[finished]
+
+    def __respawn(self, matches: np.ndarray, slots: np.ndarray):
+        if not len(matches):
+            return
+        x, y = self.distribution.sample(len(matches), self.rng)
+        self.cargo_x[matches, slots] = x
+        self.cargo_y[matches, slots] = y
+        self.cargo_state[matches, slots] = self.FLOOR
+
+
+def run_vectorized(config: Union[str, dict, Scenario], num_matches: int, seed: Union[int, np.random.SeedSequence] = None,
+                   dt: float = 0.02) -> np.ndarray:
+    """
+    Run num_matches matches in lockstep and return their RED and BLUE scores as an array of shape (num_matches, 2).
+    """
+    simulation = VectorizedSimulation(config, num_matches, seed)
+    simulation.run(dt)
+    return simulation.score
+
+
+def check_against_scalar(config: Union[str, dict], num_matches: int, seed: int = 0, dt: float = 0.02,
+                         max_z: float = MAX_Z_SCORE) -> dict:
+    """
+    Check the vectorized engine against the scalar one by running num_matches matches on both, raising an
+    AssertionError if the mean score of an alliance differs by more than max_z standard errors between them.
+    Returns the mean score of every alliance in both engines and the z-score of their difference.
+    """
+    from batch import aggregate_batch
+    scalar = aggregate_batch(config, num_matches, seed, workers=1, dt=dt, engine="tick")
+    vectorized = aggregate_batch(config, num_matches, seed, workers=1, dt=dt, engine="vector")
+    result = {}
+    for column, alliance in enumerate((Alliance.RED, Alliance.BLUE)):
+        difference = vectorized.mean[column] - scalar.mean[column]
+        error = np.sqrt((vectorized.m2[column] + scalar.m2[column]) / num_matches ** 2)
+        z_score = float(difference / error) if error else 0.0
+        result[alliance.value] = {"scalar_mean": float(scalar.mean[column]),
+                                  "vectorized_mean": float(vectorized.mean[column]),
+                                  "z_score": z_score}
+        assert abs(z_score) <= max_z, f"The {alliance.value} mean score differs between the engines by " \
+                                      f"{z_score:.2f} standard errors: {result[alliance.value]}"
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check the vectorized engine against the tick engine")
+    parser.add_argument("config", nargs="?", default="default_configs/config.json")
+    parser.add_argument("--matches", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dt", type=float, default=0.02)
+    parser.add_argument("--max-z", type=float, default=MAX_Z_SCORE,
+                        help="Largest accepted difference of the mean scores, in standard errors")
+    args = parser.parse_args()
+    print(check_against_scalar(args.config, args.matches, args.seed, args.dt, args.max_z))
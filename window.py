@@ -0,0 +1,200 @@
+from __future__ import annotations
+import sys
+import time
+from collections import deque
+from itertools import repeat
+from math import ceil
+import pygame
+from pygame.locals import *
+from cargo import FIELD_WIDTH, FIELD_HEIGHT, Cargo
+from config import parse_config
+from field import Hub
+from game import ScoreBoard
+from graphics import GraphicsArea, Renderer
+from profiling import Profiler, write_profile
+from recording import MatchRecorder, MatchRecording
+from robot import Robot
+from simulation import step
+from telemetry import TelemetryServer
+
+SCREEN_WIDTH = 1280
+SCREEN_HEIGHT = 720
+WINDOW_CAPTION = "Rapid React Simulator"
+TIME_SCALE_KEYS = {K_1: "1", K_2: "4", K_3: "16", K_4: "max"}
+QUIT_KEYS = (K_ESCAPE, K_q)
+# Seconds skipped by the arrow keys in replays
+SEEK_STEP = 5.0
+# Longest frame time the simulation keeps up with, and the part of a frame spent simulating at maximal speed
+MAX_FRAME_TIME = 0.25
+MAX_SPEED_BUDGET = 0.8
+
+
+def create_window():
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption(WINDOW_CAPTION)
+    field_area = GraphicsArea(screen, (0, 0), SCREEN_WIDTH, SCREEN_WIDTH//2, FIELD_WIDTH, FIELD_HEIGHT)
+    score_area = GraphicsArea(screen, (0, SCREEN_WIDTH//2), SCREEN_WIDTH, SCREEN_HEIGHT-SCREEN_WIDTH//2)
+    return screen, field_area, score_area
+
+
+class TimeControl:
+    """
+    Decides how many fixed simulation steps to run every rendered frame, according to the current time scale.
+    """
+
+    def __init__(self, time_scale: str, dt: float, frame_rate: int):
+        self.time_scale = time_scale
+        self.dt = dt
+        self.frame_rate = frame_rate
+        self.paused = False
+        self.pending_time = 0.0
+
+    def handle_key(self, key: int):
+        if key == K_SPACE:
+            self.paused = not self.paused
+        elif key in TIME_SCALE_KEYS:
+            self.time_scale = TIME_SCALE_KEYS[key]
+        pygame.display.set_caption(self.caption())
+
+    def caption(self) -> str:
+        return f"{WINDOW_CAPTION} - {'paused' if self.paused else self.time_scale + 'x'}"
+
+    def run_steps(self, frame_time: float, remaining_steps: int, do_step) -> int:
+        """
+        Run the simulation steps due for a frame that took frame_time seconds, and return how many were run.
+        """
+        if self.paused:
+            return 0
+        if self.time_scale == "max":
+            # Simulate for most of the frame's time budget, leaving the rest for rendering
+            deadline = time.perf_counter() + MAX_SPEED_BUDGET / self.frame_rate
+            steps = 0
+            while steps < remaining_steps and time.perf_counter() < deadline:
+                do_step()
+                steps += 1
+            return steps
+        # Slow frames (e.g. while the window is dragged) do not make the simulation catch up in a single burst
+        self.pending_time += min(frame_time, MAX_FRAME_TIME) * float(self.time_scale)
+        steps = min(int(self.pending_time / self.dt), remaining_steps)
+        self.pending_time -= steps * self.dt
+        for _ in range(steps):
+            do_step()
+        return steps
+
+
+def run(args):
+    profiler = Profiler() if args.profile else None
+    if profiler:
+        profiler.install()
+    field, bots, match_length = parse_config(args.config_file, args.seed)
+    screen, field_area, score_area = create_window()
+    renderer = Renderer(screen, [field_area, score_area])
+    field_background, score_background = renderer.background_areas()
+    field.draw_background(field_background)
+    field.score_keeper.draw_background(score_background)
+    renderer.show_background()
+
+    recorder = MatchRecorder(args.record, field, bots, match_length, dt=args.dt) if args.record else None
+    telemetry = TelemetryServer(port=args.telemetry, rate=args.telemetry_rate) if args.telemetry is not None else None
+    if telemetry:
+        telemetry.start()
+    remaining_steps = ceil(match_length / args.dt - 1e-9)
+    steps_done = 0
+
+    def do_step():
+        # remaining_steps is only updated once a frame's steps are done, so the steps are counted here
+        nonlocal steps_done
+        step(field, bots, args.dt)
+        steps_done += 1
+        if recorder:
+            recorder.capture(field, steps_done * args.dt)
+        if telemetry:
+            telemetry.publish(field, bots, steps_done * args.dt)
+
+    time_control = TimeControl(args.time_scale, args.dt, args.fps)
+    pygame.display.set_caption(time_control.caption())
+    clock = pygame.time.Clock()
+    try:
+        while remaining_steps:
+            frame_time = clock.tick(args.fps) / 1000
+            for event in pygame.event.get():
+                if event.type == QUIT or (event.type == KEYDOWN and event.key in QUIT_KEYS):
+                    sys.exit()
+                if event.type == KEYDOWN:
+                    time_control.handle_key(event.key)
+            remaining_steps -= time_control.run_steps(frame_time, remaining_steps, do_step)
+
+            renderer.begin_frame()
+            field.draw(field_area)
+            for bot in bots:
+                bot.draw(field_area)
+            field.score_keeper.draw(score_area)
+            renderer.end_frame()
+    finally:
+        # Also reached when quitting in the middle of the match
+        if profiler:
+            profiler.uninstall()
+            write_profile(profiler.summary(field.score_keeper.time), args.profile)
+        if telemetry:
+            telemetry.publish(field, bots, steps_done * args.dt, force=True)
+            telemetry.stop()
+        # The recording is only written when closed, so a match quit midway is recorded up to that point
+        if recorder:
+            recorder.close()
+
+    while True:
+        for event in pygame.event.get():
+            if event.type in (QUIT, KEYDOWN):
+                sys.exit()
+
+
+def replay(args):
+    recording = MatchRecording(args.recording)
+    screen, field_area, score_area = create_window()
+    renderer = Renderer(screen, [field_area, score_area])
+    field_background, score_background = renderer.background_areas()
+    hub = Hub(0.0)
+    score_keeper = ScoreBoard()
+    field_background.fill("white")
+    hub.draw_background(field_background)
+    score_keeper.draw_background(score_background)
+    renderer.show_background()
+    bots = [Robot((0.0, 0.0), 0.0, 0.0, 1.0, 1.0, alliance) for alliance in recording.alliances]
+
+    time_control = TimeControl(args.time_scale, recording.sample_interval, args.fps)
+    pygame.display.set_caption(time_control.caption())
+    clock = pygame.time.Clock()
+    index = 0
+    last_index = len(recording) - 1
+    while True:
+        frame_time = clock.tick(args.fps) / 1000
+        for event in pygame.event.get():
+            if event.type == QUIT or (event.type == KEYDOWN and event.key in QUIT_KEYS):
+                sys.exit()
+            if event.type != KEYDOWN:
+                continue
+            if event.key in (K_LEFT, K_RIGHT):
+                seek = SEEK_STEP if event.key == K_RIGHT else -SEEK_STEP
+                index = recording.frame_at(recording.time_at(index) + seek)
+            elif event.key in (K_HOME, K_END):
+                index = 0 if event.key == K_HOME else last_index
+            else:
+                time_control.handle_key(event.key)
+        index += time_control.run_steps(frame_time, last_index - index, lambda: None)
+
+        state = recording.state_at(index)
+        score_keeper.score, score_keeper.time = state["score"], state["time"]
+        for alliance, count in state["hub"].items():
+            hub.cargo_timeouts[alliance] = deque(repeat(0.0, count))
+        for bot, (position, action, num_cargo) in zip(bots, state["robots"]):
+            bot.position, bot.current_action, bot.num_cargo = position, action, num_cargo
+
+        renderer.begin_frame()
+        for x, y, alliance in state["cargo"]:
+            Cargo(x, y, alliance).draw(field_area)
+        hub.draw(field_area)
+        for bot in bots:
+            bot.draw(field_area)
+        score_keeper.draw(score_area)
+        renderer.end_frame()